@@ -1,13 +1,46 @@
 import os
 import sys
-import wmi
+import csv
 import json
+import math
+import mmap
+import time
+import zlib
+import array
+import heapq
+import bisect
 import psutil
-import pygame
+import random
+import socket
+import struct
+import ctypes
 import elevate
+import sqlite3
+import argparse
 import datetime
+import tempfile
+import threading
+import contextlib
+import collections
+import ctypes.util
+import concurrent.futures
+from xml.etree import ElementTree
+from html.parser import HTMLParser
 from PyQt5.QtGui import QIcon, QFont
-from PyQt5.QtCore import Qt, QTime, QTimer, QSettings
+from PyQt5.QtCore import (
+    Qt,
+    QEvent,
+    QTimer,
+    QObject,
+    QSettings,
+    QThread,
+    pyqtSlot,
+    pyqtSignal,
+    QModelIndex,
+    QSocketNotifier,
+    QFileSystemWatcher,
+    QAbstractTableModel,
+)
 from PyQt5.QtWidgets import (
     QMenu,
     QLabel,
@@ -19,13 +52,16 @@ from PyQt5.QtWidgets import (
     QTextEdit,
     QGroupBox,
     QComboBox,
+    QStyle,
     QHeaderView,
     QPushButton,
     QMessageBox,
     QFormLayout,
+    QFileDialog,
     QMainWindow,
     QGridLayout,
     QVBoxLayout,
+    QTableView,
     QTextBrowser,
     QTableWidget,
     QApplication,
@@ -34,6 +70,21 @@ from PyQt5.QtWidgets import (
     QAbstractItemView,
 )
 
+try:
+    import wmi
+except ImportError:
+    wmi = None
+
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
 
 class Entities:
     appStyle = "Fusion"
@@ -66,6 +117,52 @@ class Entities:
     manualWindowSize = 800, 600
     manualWindowIcon = "manual-window-icon"
 
+    samplerInterval = 1
+    statusInterval = 2
+
+    batteryCareLowThreshold = 21
+    batteryCareHighThreshold = 80
+
+    pollingMinInterval = 1
+    pollingMaxInterval = 30
+    pollingThresholdMargin = 3
+    pollingSecondsPerPercent = 2
+    pollingSettleTime = 60
+
+    powerSupplyPath = "/sys/class/power_supply"
+
+    suspendGapFactor = 4
+    suspendMinGap = 60
+
+    historyFile = "battery-history.db"
+    historyBatchSize = 32
+    historyMaxAge = 60
+    historyReloadLimit = 1000
+    historyWindowSize = 100000
+    historyQueueCapacity = 1024
+    historyQueuePolicy = "coalesce"
+
+    ringFile = "battery-samples.ring"
+    ringCapacity = 7 * 24 * 3600
+
+    rollupTiers = (
+        ("minute", 60, 3 * 24 * 3600),
+        ("hour", 3600, 90 * 24 * 3600),
+        ("day", 24 * 3600, 10 * 365 * 24 * 3600),
+    )
+    rollupMaxGap = 300
+    rollupMaxBuckets = 1000
+
+    countersFile = "program-counters.dat"
+    countersJournalFile = "program-counters.journal"
+    countersCheckpointInterval = 300
+
+    settingsFile = "program-settings.json"
+    settingsDebounceMs = 250
+    legacySettingsFile = "program-settings.db"
+    legacyStatusFile = "program-status.db"
+    migrationMarkerFile = "program-migrated.json"
+
     globalStyleSheet = """
         color: white;
         background-color: #2c3e50;
@@ -95,124 +192,3127 @@ class Entities:
     """
 
 
-class SettingsStatus:
-    def __init__(self):
-        self.settingsFile = "program-settings.json"
+class SettingsStatus(QObject):
+    settingChanged = pyqtSignal(str, object)
+    batteryCareChanged = pyqtSignal(bool)
+    batteryCareNotifChanged = pyqtSignal(bool)
+    startAtStartupChanged = pyqtSignal(bool)
+    startMinimizeChanged = pyqtSignal(bool)
+    resetTimesAfterBatteryStatusChsngedChanged = pyqtSignal(bool)
+
+    defaults = {
+        "batteryCare": True,
+        "batteryCareNotif": True,
+        "startAtStartup": False,
+        "startMinimize": True,
+        "resetTimesAfterBatteryStatusChsnged": True,
+    }
+    sharedInstance = None
+
+    def __init__(self, settingsFile=Entities.settingsFile):
+        super().__init__()
+        self.settingsFile = settingsFile
+        self.fileStamp = None
+        self.loads = 0
+        self.saves = 0
+        self.batchDepth = 0
+        self.dirty = False
         self.loadSettings()
 
+    @classmethod
+    def shared(cls):
+        if cls.sharedInstance is None:
+            cls.sharedInstance = cls()
+        return cls.sharedInstance
+
+    def values(self):
+        return {key: getattr(self, key) for key in self.defaults}
+
+    def updateValue(self, key, value):
+        if key in self.__dict__ and getattr(self, key) == value:
+            return
+        setattr(self, key, value)
+        getattr(self, key + "Changed").emit(value)
+        self.settingChanged.emit(key, value)
+
+    def readStamp(self):
+        try:
+            stat = os.stat(self.settingsFile)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        stamp = self.readStamp()
+        if stamp is None:
+            self.loadSettings()
+        elif stamp != self.fileStamp:
+            self.reloadFile()
+
+    def validate(self, settings_data):
+        if not isinstance(settings_data, dict):
+            return None
+        values = {}
+        for key, default in self.defaults.items():
+            value = settings_data.get(key, default)
+            if not isinstance(value, bool):
+                return None
+            values[key] = value
+        return values
+
+    def reloadFile(self):
+        stamp = self.readStamp()
+        if stamp is None or stamp == self.fileStamp:
+            return False
+        try:
+            with open(self.settingsFile, "r") as file:
+                values = self.validate(json.load(file))
+        except (OSError, ValueError):
+            return False
+        if values is None:
+            return False
+
+        self.loads += 1
+        self.fileStamp = stamp
+        for key, value in values.items():
+            self.updateValue(key, value)
+        return True
+
     def loadSettings(self):
+        self.loads += 1
         try:
+            self.fileStamp = self.readStamp()
             with open(self.settingsFile, "r") as file:
                 settings_data = json.load(file)
-            self.batteryCare = settings_data.get("batteryCare", True)
-            self.batteryCareNotif = settings_data.get("batteryCareNotif", True)
-            self.startAtStartup = settings_data.get("startAtStartup", False)
-            self.startMinimize = settings_data.get("startMinimize", True)
-            self.resetTimesAfterBatteryStatusChsnged = settings_data.get(
-                "resetTimesAfterBatteryStatusChsnged", True
-            )
+            for key, default in self.defaults.items():
+                self.updateValue(key, settings_data.get(key, default))
         except FileNotFoundError:
-            self.batteryCare = True
-            self.batteryCareNotif = True
-            self.startAtStartup = False
-            self.startMinimize = True
-            self.resetTimesAfterBatteryStatusChsnged = True
+            for key, default in self.defaults.items():
+                self.updateValue(key, default)
             self.saveSettings()
 
     def saveSettings(self):
-        settings_data = {
-            "batteryCare": self.batteryCare,
-            "batteryCareNotif": self.batteryCareNotif,
-            "startAtStartup": self.startAtStartup,
-            "startMinimize": self.startMinimize,
-            "resetTimesAfterBatteryStatusChsnged": self.resetTimesAfterBatteryStatusChsnged,
-        }
-        with open(self.settingsFile, "w") as file:
+        settings_data = self.values()
+        tempFile = self.settingsFile + ".tmp"
+        with open(tempFile, "w") as file:
             json.dump(settings_data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tempFile, self.settingsFile)
+        self.fileStamp = self.readStamp()
+        self.saves += 1
+        self.dirty = False
+
+    def setValues(self, values):
+        with self.batch():
+            for key, value in values.items():
+                self.updateValue(key, value)
+            self.persist()
+
+    def persist(self):
+        if self.batchDepth:
+            self.dirty = True
+        else:
+            self.saveSettings()
+
+    @contextlib.contextmanager
+    def batch(self):
+        self.batchDepth += 1
+        try:
+            yield self
+        except BaseException:
+            self.batchDepth -= 1
+            if not self.batchDepth:
+                self.loadSettings()
+                self.dirty = False
+            raise
+        self.batchDepth -= 1
+        if not self.batchDepth and self.dirty:
+            self.saveSettings()
 
     def setBatteryCare(self, value):
-        self.batteryCare = value
-        self.saveSettings()
+        self.updateValue("batteryCare", value)
+        self.persist()
 
     def getBatteryCare(self):
-        self.loadSettings()
+        self.refresh()
         return self.batteryCare
 
     def setBatteryCareNotif(self, value):
-        self.batteryCareNotif = value
-        self.saveSettings()
+        self.updateValue("batteryCareNotif", value)
+        self.persist()
 
     def getBatteryCareNotif(self):
-        self.loadSettings()
+        self.refresh()
         return self.batteryCareNotif
 
     def setStartAtStartup(self, value):
-        self.startAtStartup = value
-        self.saveSettings()
+        self.updateValue("startAtStartup", value)
+        self.persist()
 
     def getStartAtStartup(self):
-        self.loadSettings()
+        self.refresh()
         return self.startAtStartup
 
     def setStartMinimize(self, value):
-        self.startMinimize = value
-        self.saveSettings()
+        self.updateValue("startMinimize", value)
+        self.persist()
 
     def getStartMinimize(self):
-        self.loadSettings()
+        self.refresh()
         return self.startMinimize
 
     def setResetTimesAfterBatteryStatusChsnged(self, value):
-        self.resetTimesAfterBatteryStatusChsnged = value
-        self.saveSettings()
+        self.updateValue("resetTimesAfterBatteryStatusChsnged", value)
+        self.persist()
 
     def getResetTimesAfterBatteryStatusChsnged(self):
-        self.loadSettings()
+        self.refresh()
         return self.resetTimesAfterBatteryStatusChsnged
 
 
-class CustomTableWidget(QTableWidget):
+class LegacyMigration:
+    legacySettingsColumns = (
+        "batteryCare",
+        "batteryCareNotif",
+        "startAtStartup",
+        "startMinimize",
+        "resetTimesAfterBatteryStatusChsnged",
+    )
+
+    def __init__(self, markerFile, settingsFile, legacySettingsFile, legacyStatusFile):
+        self.markerFile = markerFile
+        self.settingsFile = settingsFile
+        self.legacySettingsFile = legacySettingsFile
+        self.legacyStatusFile = legacyStatusFile
+
+    @classmethod
+    def fromEntities(cls, entities):
+        return cls(
+            entities.migrationMarkerFile,
+            entities.settingsFile,
+            entities.legacySettingsFile,
+            entities.legacyStatusFile,
+        )
+
+    @staticmethod
+    def readLegacy(path, query):
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            conn.execute("BEGIN")
+            return conn.execute(query).fetchone()
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def run(self):
+        if os.path.exists(self.markerFile):
+            return None
+
+        row = self.readLegacy(
+            self.legacySettingsFile,
+            f"SELECT {', '.join(self.legacySettingsColumns)} FROM settings WHERE id = 1",
+        )
+        status = self.readLegacy(
+            self.legacyStatusFile, "SELECT running FROM program_status WHERE id = 1"
+        )
+
+        report = {
+            "migratedAt": int(time.time()),
+            "legacySettings": row is not None,
+            "legacyStatus": status is not None,
+            "settingsImported": False,
+        }
+        if row is not None and not os.path.exists(self.settingsFile):
+            values = {
+                key: bool(value)
+                for key, value in zip(self.legacySettingsColumns, row)
+                if value is not None
+            }
+            SettingsStatus(self.settingsFile).setValues(values)
+            report["settingsImported"] = True
+
+        with open(self.markerFile, "w") as file:
+            json.dump(report, file, indent=4)
+        return report
+
+
+BatteryUnit = collections.namedtuple(
+    "BatteryUnit",
+    [
+        "name",
+        "percent",
+        "energyNow",
+        "powerNow",
+        "voltage",
+        "cycleCount",
+        "capacity",
+    ],
+)
+
+
+BatteryReading = collections.namedtuple(
+    "BatteryReading",
+    [
+        "percent",
+        "secsleft",
+        "power_plugged",
+        "energyNow",
+        "powerNow",
+        "voltage",
+        "cycleCount",
+        "capacity",
+        "batteries",
+    ],
+)
+
+
+def combineBatteries(batteries, plugged):
+    energyNow = sum(unit.energyNow or 0 for unit in batteries)
+    capacity = sum(unit.capacity or 0 for unit in batteries)
+    powerNow = sum(unit.powerNow or 0 for unit in batteries)
+    hasEnergy = all(unit.energyNow is not None and unit.capacity for unit in batteries)
+
+    if hasEnergy:
+        percent = round(energyNow * 100 / capacity)
+    else:
+        percent = round(sum(unit.percent for unit in batteries) / len(batteries))
+
+    if plugged:
+        secsleft = psutil.POWER_TIME_UNLIMITED
+    elif hasEnergy and powerNow:
+        secsleft = int(energyNow / powerNow * 3600)
+    else:
+        secsleft = psutil.POWER_TIME_UNKNOWN
+
+    primary = batteries[0]
+    return BatteryReading(
+        min(percent, 100),
+        secsleft,
+        plugged,
+        energyNow if hasEnergy else None,
+        powerNow if any(unit.powerNow is not None for unit in batteries) else None,
+        primary.voltage,
+        primary.cycleCount,
+        capacity if hasEnergy else None,
+        tuple(batteries),
+    )
+
+
+class PsutilBatteryBackend:
+    name = "psutil"
+
+    def read(self):
+        battery = psutil.sensors_battery()
+        if battery is None:
+            raise OSError("No battery reported by psutil")
+        return BatteryReading(
+            battery.percent,
+            battery.secsleft,
+            battery.power_plugged,
+            None,
+            None,
+            None,
+            None,
+            None,
+            (BatteryUnit("BAT", battery.percent, None, None, None, None, None),),
+        )
+
+    def close(self):
+        pass
+
+
+class SysfsBatteryBackend:
+    name = "sysfs"
+
+    batteryAttributes = (
+        "capacity",
+        "status",
+        "energy_now",
+        "energy_full",
+        "charge_now",
+        "charge_full",
+        "power_now",
+        "current_now",
+        "voltage_now",
+        "cycle_count",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.batteries = []
+        self.onlineFds = []
+        self.open()
+
+    def open(self):
+        for supply in sorted(os.listdir(self.path)):
+            supplyPath = os.path.join(self.path, supply)
+            supplyType = self.readFile(os.path.join(supplyPath, "type"))
+            if supplyType == "Battery":
+                scope = self.readFile(os.path.join(supplyPath, "scope"))
+                if not self.isSystemBattery(supply, scope):
+                    continue
+                batteryFds = {}
+                for attribute in self.batteryAttributes:
+                    fd = self.openFile(os.path.join(supplyPath, attribute))
+                    if fd is not None:
+                        batteryFds[attribute] = fd
+                if "capacity" in batteryFds:
+                    self.batteries.append((supply, batteryFds))
+                else:
+                    self.closeFds(batteryFds.values())
+            elif supplyType in ("Mains", "USB"):
+                fd = self.openFile(os.path.join(supplyPath, "online"))
+                if fd is not None:
+                    self.onlineFds.append(fd)
+
+        if not self.batteries:
+            self.close()
+            raise OSError(f"No battery found in {self.path}")
+
+    @staticmethod
+    def isSystemBattery(supply, scope):
+        if scope is not None:
+            return scope == "System"
+        return supply.startswith("BAT")
+
+    def close(self):
+        for _, batteryFds in self.batteries:
+            self.closeFds(batteryFds.values())
+        self.closeFds(self.onlineFds)
+        self.batteries = []
+        self.onlineFds = []
+
+    @staticmethod
+    def closeFds(fds):
+        for fd in fds:
+            os.close(fd)
+
+    @staticmethod
+    def readFile(path):
+        try:
+            with open(path, "r") as file:
+                return file.read().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def openFile(path):
+        try:
+            return os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+
+    @staticmethod
+    def readFd(fd):
+        try:
+            return os.pread(fd, 64, 0).strip()
+        except OSError:
+            return None
+
+    def readInt(self, batteryFds, attribute):
+        fd = batteryFds.get(attribute)
+        if fd is None:
+            return None
+        value = self.readFd(fd)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def readPlugged(self):
+        if self.onlineFds:
+            return any(self.readFd(fd) == b"1" for fd in self.onlineFds)
+
+        statuses = [
+            self.readFd(batteryFds["status"])
+            for _, batteryFds in self.batteries
+            if "status" in batteryFds
+        ]
+        if not statuses:
+            return None
+        return any(status != b"Discharging" for status in statuses)
+
+    def readUnit(self, name, batteryFds):
+        voltage = self.readInt(batteryFds, "voltage_now")
+        energyNow = self.readInt(batteryFds, "energy_now")
+        capacity = self.readInt(batteryFds, "energy_full")
+        powerNow = self.readInt(batteryFds, "power_now")
+        if energyNow is None and voltage is not None:
+            chargeNow = self.readInt(batteryFds, "charge_now")
+            chargeFull = self.readInt(batteryFds, "charge_full")
+            currentNow = self.readInt(batteryFds, "current_now")
+            if chargeNow is not None:
+                energyNow = chargeNow * voltage // 1000000
+            if chargeFull is not None:
+                capacity = chargeFull * voltage // 1000000
+            if currentNow is not None:
+                powerNow = abs(currentNow) * voltage // 1000000
+
+        return BatteryUnit(
+            name,
+            self.readInt(batteryFds, "capacity"),
+            energyNow / 1000000 if energyNow is not None else None,
+            powerNow / 1000000 if powerNow is not None else None,
+            voltage / 1000000 if voltage is not None else None,
+            self.readInt(batteryFds, "cycle_count"),
+            capacity / 1000000 if capacity is not None else None,
+        )
+
+    def read(self):
+        batteries = [
+            self.readUnit(name, batteryFds) for name, batteryFds in self.batteries
+        ]
+        return combineBatteries(batteries, self.readPlugged())
+
+
+class WmiBatteryBackend:
+    name = "wmi"
+
+    def __init__(self):
+        self.connections = {}
+        units, _ = self.readUnits(self.connect())
+        if not units:
+            raise OSError("No battery found through WMI")
+
+    def connect(self):
+        thread = threading.get_ident()
+        connection = self.connections.get(thread)
+        if connection is None:
+            if pythoncom is not None:
+                pythoncom.CoInitialize()
+            connection = wmi.WMI(namespace="wmi")
+            self.connections[thread] = connection
+        return connection
+
+    def close(self):
+        self.connections = {}
+
+    @staticmethod
+    def byInstance(instances, attribute):
+        return {
+            instance.InstanceName: getattr(instance, attribute)
+            for instance in instances
+        }
+
+    def readUnits(self, connection):
+        fullCapacities = self.byInstance(
+            connection.BatteryFullChargedCapacity(), "FullChargedCapacity"
+        )
+        try:
+            cycleCounts = self.byInstance(connection.BatteryCycleCount(), "CycleCount")
+        except wmi.x_wmi:
+            cycleCounts = {}
+
+        units = []
+        plugged = False
+        for status in sorted(
+            connection.BatteryStatus(), key=lambda status: status.InstanceName
+        ):
+            fullCapacity = fullCapacities.get(status.InstanceName)
+            if not fullCapacity or status.RemainingCapacity is None:
+                continue
+            plugged = plugged or bool(status.PowerOnline)
+            rate = status.ChargeRate if status.Charging else status.DischargeRate
+            units.append(
+                BatteryUnit(
+                    f"BAT{len(units)}",
+                    min(round(status.RemainingCapacity * 100 / fullCapacity), 100),
+                    status.RemainingCapacity / 1000,
+                    rate / 1000 if rate is not None else None,
+                    status.Voltage / 1000 if status.Voltage else None,
+                    cycleCounts.get(status.InstanceName),
+                    fullCapacity / 1000,
+                )
+            )
+        return units, plugged
+
+    def read(self):
+        units, plugged = self.readUnits(self.connect())
+        if not units:
+            raise OSError("No battery found through WMI")
+        return combineBatteries(units, plugged)
+
+
+def openBatteryBackend(path):
+    if sys.platform.startswith("linux"):
+        try:
+            return SysfsBatteryBackend(path)
+        except OSError:
+            pass
+    elif sys.platform == "win32" and wmi is not None:
+        try:
+            return WmiBatteryBackend()
+        except (OSError, wmi.x_wmi):
+            pass
+    return PsutilBatteryBackend()
+
+
+BatterySample = collections.namedtuple(
+    "BatterySample",
+    [
+        "timestamp",
+        "monotonicNs",
+        "boottimeNs",
+        "percent",
+        "plugged",
+        "secsleft",
+        "brightness",
+        "batteries",
+        "energy",
+        "power",
+    ],
+)
+
+
+class SensorBackend:
+    def now(self):
+        return time.time()
+
+    def monotonicNs(self):
+        return time.monotonic_ns()
+
+    def boottimeNs(self):
+        if hasattr(time, "CLOCK_BOOTTIME"):
+            return time.clock_gettime_ns(time.CLOCK_BOOTTIME)
+        return None
+
+    def readBattery(self):
+        raise NotImplementedError
+
+    def getBrightness(self):
+        return None
+
+    def setBrightness(self, level):
+        pass
+
+    def playSound(self, soundFile):
+        pass
+
+    def readSample(self):
+        battery = self.readBattery()
+        return BatterySample(
+            self.now(),
+            self.monotonicNs(),
+            self.boottimeNs(),
+            battery.percent,
+            battery.power_plugged,
+            battery.secsleft,
+            None,
+            battery.batteries,
+            battery.energyNow,
+            battery.powerNow,
+        )
+
+    def close(self):
+        pass
+
+
+class LiveSensorBackend(SensorBackend):
+    def __init__(self, batteryBackend):
+        self.batteryBackend = batteryBackend
+        self.wmiConnection = None
+        self.mixerReady = False
+
+    def readBattery(self):
+        return self.batteryBackend.read()
+
+    def connectWmi(self):
+        if self.wmiConnection is None:
+            if pythoncom is not None:
+                pythoncom.CoInitialize()
+            self.wmiConnection = wmi.WMI(namespace="wmi")
+        return self.wmiConnection
+
+    def getBrightness(self):
+        if wmi is None:
+            return None
+        c = self.connectWmi()
+        return c.WmiMonitorBrightness()[0].CurrentBrightness
+
+    def setBrightness(self, level):
+        if wmi is None:
+            return
+        c = self.connectWmi()
+        methods = c.WmiMonitorBrightnessMethods()[0]
+        methods.WmiSetBrightness(level, 0)
+
+    def playSound(self, soundFile):
+        if pygame is None:
+            return
+        if not self.mixerReady:
+            pygame.mixer.init()
+            self.mixerReady = True
+        pygame.mixer.music.load(soundFile)
+        pygame.mixer.music.play()
+
+    def close(self):
+        self.batteryBackend.close()
+
+
+class ReplaySensorBackend(SensorBackend):
+    def __init__(self, path, speedUp=0):
+        self.path = path
+        self.speedUp = speedUp
+        self.records = self.readTrace(path)
+        self.record = next(self.records)
+        self.nextRecord = next(self.records, None)
+        self.finished = self.nextRecord is None
+        self.brightness = self.record.get("brightness")
+        self.sounds = 0
+        self.replayStart = time.monotonic()
+        self.traceStart = self.record["timestamp"]
+        self.traceTime = None
+
+    @staticmethod
+    def parseRecord(record):
+        plugged = record.get("plugged")
+        if isinstance(plugged, str):
+            plugged = plugged.strip().lower() in ("1", "true", "plugged")
+
+        parsed = {
+            "timestamp": float(record["timestamp"]),
+            "percent": int(float(record["percent"])),
+            "plugged": bool(plugged),
+            "secsleft": int(float(record.get("secsleft") or -1)),
+        }
+        if record.get("brightness") not in (None, ""):
+            parsed["brightness"] = int(float(record["brightness"]))
+
+        batteries = record.get("batteries") or [
+            {"name": "BAT", "percent": parsed["percent"]}
+        ]
+        parsed["batteries"] = tuple(
+            BatteryUnit(
+                battery["name"],
+                int(battery["percent"]),
+                battery.get("energyNow"),
+                battery.get("powerNow"),
+                battery.get("voltage"),
+                battery.get("cycleCount"),
+                battery.get("capacity"),
+            )
+            for battery in batteries
+        )
+        return parsed
+
+    @classmethod
+    def readTrace(cls, path):
+        with open(path, "r", newline="") as file:
+            if path.endswith(".csv"):
+                for record in csv.DictReader(file):
+                    yield cls.parseRecord(record)
+            else:
+                for line in file:
+                    if line.strip():
+                        yield cls.parseRecord(json.loads(line))
+
+    def advance(self):
+        self.record = self.nextRecord
+        self.nextRecord = next(self.records, None)
+        self.finished = self.nextRecord is None
+        if "brightness" in self.record:
+            self.brightness = self.record["brightness"]
+
+    def updateTraceTime(self):
+        if self.speedUp > 0:
+            elapsed = time.monotonic() - self.replayStart
+            self.traceTime = self.traceStart + elapsed * self.speedUp
+            while (
+                self.nextRecord is not None
+                and self.nextRecord["timestamp"] <= self.traceTime
+            ):
+                self.advance()
+        else:
+            if self.traceTime is not None and not self.finished:
+                self.advance()
+            self.traceTime = self.record["timestamp"]
+
+    def now(self):
+        return self.traceTime
+
+    def monotonicNs(self):
+        return int((self.traceTime - self.traceStart) * 1000000000)
+
+    def boottimeNs(self):
+        return None
+
+    def readBattery(self):
+        self.updateTraceTime()
+        return BatteryReading(
+            self.record["percent"],
+            self.record["secsleft"],
+            self.record["plugged"],
+            None,
+            None,
+            None,
+            None,
+            None,
+            self.record["batteries"],
+        )
+
+    def getBrightness(self):
+        return self.brightness
+
+    def setBrightness(self, level):
+        self.brightness = level
+
+    def playSound(self, soundFile):
+        self.sounds += 1
+
+    def close(self):
+        self.records.close()
+
+
+class LatencyStats:
     def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def record(self, name, elapsedNs):
+        with self.lock:
+            stats = self.calls.setdefault(name, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += elapsedNs
+            stats[2] = max(stats[2], elapsedNs)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                name: {
+                    "count": count,
+                    "meanMs": totalNs / count / 1000000,
+                    "maxMs": maxNs / 1000000,
+                }
+                for name, (count, totalNs, maxNs) in self.calls.items()
+            }
+
+
+class SensorWorker(QObject):
+    sampleReady = pyqtSignal(object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, backend):
         super().__init__()
+        self.backend = backend
+        self.latency = LatencyStats()
+
+    def timed(self, name, function, *args):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args)
+        except Exception as error:
+            self.failed.emit(name, str(error))
+        finally:
+            self.latency.record(name, time.perf_counter_ns() - start)
+
+    @pyqtSlot()
+    def readSample(self):
+        sample = self.timed("readSample", self.backend.readSample)
+        if sample is not None:
+            brightness = self.timed("getBrightness", self.backend.getBrightness)
+            self.sampleReady.emit(sample._replace(brightness=brightness))
+
+    @pyqtSlot(int)
+    def setBrightness(self, level):
+        self.timed("setBrightness", self.backend.setBrightness, level)
+
+    @pyqtSlot(str)
+    def playSound(self, soundFile):
+        self.timed("playSound", self.backend.playSound, soundFile)
+
+
+class PollingPolicy:
+    def __init__(
+        self,
+        minInterval,
+        maxInterval,
+        thresholds,
+        thresholdMargin,
+        secondsPerPercent,
+        settleTime,
+    ):
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.thresholds = thresholds
+        self.thresholdMargin = thresholdMargin
+        self.secondsPerPercent = secondsPerPercent
+        self.settleTime = settleTime
+
+    @classmethod
+    def fromEntities(cls, entities):
+        return cls(
+            entities.pollingMinInterval,
+            entities.pollingMaxInterval,
+            (entities.batteryCareLowThreshold, entities.batteryCareHighThreshold),
+            entities.pollingThresholdMargin,
+            entities.pollingSecondsPerPercent,
+            entities.pollingSettleTime,
+        )
+
+    def interval(self, sample, sinceStatusChange):
+        if sinceStatusChange < self.settleTime:
+            return self.minInterval
+
+        distance = min(abs(sample.percent - level) for level in self.thresholds)
+        if distance <= self.thresholdMargin:
+            return self.minInterval
+
+        interval = (
+            self.minInterval
+            + (distance - self.thresholdMargin) * self.secondsPerPercent
+        )
+        return min(interval, self.maxInterval)
+
+
+class AdaptivePollScheduler:
+    def __init__(self, policy):
+        self.policy = policy
+        self.interactive = False
+        self.prevPlugged = None
+        self.statusChangeTime = None
+        self.startTime = time.monotonic()
+        self.samples = 0
+        self.intervalCounts = collections.Counter()
+
+    def setInteractive(self, interactive):
+        self.interactive = interactive
+
+    def nextInterval(self, sample, now):
+        self.samples += 1
+
+        if sample.plugged != self.prevPlugged:
+            self.prevPlugged = sample.plugged
+            self.statusChangeTime = now
+
+        if self.interactive:
+            interval = self.policy.minInterval
+        else:
+            interval = self.policy.interval(sample, now - self.statusChangeTime)
+
+        self.intervalCounts[interval] += 1
+        return interval
+
+    def getEffectiveRate(self):
+        elapsed = time.monotonic() - self.startTime
+        if elapsed <= 0:
+            return 0.0
+        return self.samples / elapsed
+
+    def resetCounters(self):
+        self.startTime = time.monotonic()
+        self.samples = 0
+        self.intervalCounts.clear()
+
+
+class TickClock:
+    def __init__(self, clock=time.monotonic_ns):
+        self.clock = clock
+        self.deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.resyncs = 0
+        self.maxLatenessNs = 0
+        self.lastNowNs = None
+
+    def nextDelay(self, interval):
+        now = self.clock()
+        intervalNs = int(interval * 1000000000)
+        self.ticks += 1
+
+        if self.deadline is None or now < self.deadline - intervalNs:
+            if self.lastNowNs is not None and now < self.lastNowNs:
+                self.resyncs += 1
+            self.deadline = now + intervalNs
+        elif now >= self.deadline:
+            self.maxLatenessNs = max(self.maxLatenessNs, now - self.deadline)
+            self.deadline += intervalNs
+            if self.deadline <= now:
+                missed = (now - self.deadline) // intervalNs + 1
+                self.overruns += missed
+                self.deadline += missed * intervalNs
+
+        self.lastNowNs = now
+        return (self.deadline - now + 999999) // 1000000
+
+
+class TimeCounters:
+    def __init__(self, suspendGapFactor=4, suspendMinGap=60):
+        self.inUseNs = 0
+        self.batteryNs = 0
+        self.pluggedNs = 0
+        self.suspendedNs = 0
+        self.lastTickNs = None
+        self.suspendOffsetNs = None
+        self.clockJumps = 0
+        self.suspends = 0
+        self.suspendGapFactor = suspendGapFactor
+        self.suspendMinGapNs = int(suspendMinGap * 1000000000)
+
+    def accumulate(self, monotonicNs, plugged, boottimeNs=None, expectedNs=None):
+        elapsedNs = 0
+        suspendedNs = 0
+        if self.lastTickNs is not None:
+            elapsedNs = monotonicNs - self.lastTickNs
+            if elapsedNs < 0:
+                self.clockJumps += 1
+                elapsedNs = 0
+            elif boottimeNs is not None and self.suspendOffsetNs is not None:
+                suspendedNs = max(0, boottimeNs - monotonicNs - self.suspendOffsetNs)
+            elif expectedNs is not None and elapsedNs > max(
+                expectedNs * self.suspendGapFactor, self.suspendMinGapNs
+            ):
+                suspendedNs = elapsedNs - expectedNs
+                elapsedNs = expectedNs
+        self.lastTickNs = monotonicNs
+
+        if boottimeNs is not None:
+            offsetNs = boottimeNs - monotonicNs
+            if self.suspendOffsetNs is None or offsetNs > self.suspendOffsetNs:
+                self.suspendOffsetNs = offsetNs
+
+        if suspendedNs >= self.suspendMinGapNs:
+            self.suspends += 1
+        self.suspendedNs += suspendedNs
+
+        self.inUseNs += elapsedNs
+        if plugged:
+            self.pluggedNs += elapsedNs
+        else:
+            self.batteryNs += elapsedNs
+        return elapsedNs
+
+    @staticmethod
+    def format(ns):
+        return str(datetime.timedelta(seconds=ns // 1000000000))
+
+
+class CounterJournal:
+    magic = b"BTCJ"
+    checkpointFormat = "<4sIQQQQ"
+    recordFormat = "<IIIII"
+    crcFormat = "<I"
+
+    def __init__(self, countersFile, journalFile, checkpointInterval):
+        self.countersFile = countersFile
+        self.journalFile = journalFile
+        self.checkpointInterval = checkpointInterval
+        self.sequence = 0
+        self.lastValues = None
+        self.lastCheckpoint = time.monotonic()
+        self.recordSize = struct.calcsize(self.recordFormat) + 4
+        self.file = open(self.journalFile, "a+b", buffering=0)
+
+    @staticmethod
+    def values(timeCounters):
+        return (
+            timeCounters.inUseNs // 1000000000,
+            timeCounters.batteryNs // 1000000000,
+            timeCounters.pluggedNs // 1000000000,
+            timeCounters.suspendedNs // 1000000000,
+        )
+
+    def seal(self, data):
+        return data + struct.pack(self.crcFormat, zlib.crc32(data))
+
+    def unseal(self, data):
+        payload = data[:-4]
+        (crc,) = struct.unpack(self.crcFormat, data[-4:])
+        return payload if zlib.crc32(payload) == crc else None
+
+    def readCheckpoint(self):
+        size = struct.calcsize(self.checkpointFormat) + 4
+        try:
+            with open(self.countersFile, "rb") as file:
+                data = file.read(size)
+        except FileNotFoundError:
+            return None
+        if len(data) != size:
+            return None
+        payload = self.unseal(data)
+        if payload is None:
+            return None
+        magic, sequence, *values = struct.unpack(self.checkpointFormat, payload)
+        if magic != self.magic:
+            return None
+        return sequence, tuple(values)
+
+    def readLastRecord(self):
+        size = self.file.seek(0, os.SEEK_END)
+        offset = size - size % self.recordSize - self.recordSize
+        while offset >= 0:
+            self.file.seek(offset)
+            payload = self.unseal(self.file.read(self.recordSize))
+            if payload is not None:
+                if size > offset + self.recordSize:
+                    self.file.truncate(offset + self.recordSize)
+                sequence, *values = struct.unpack(self.recordFormat, payload)
+                return sequence, tuple(values)
+            offset -= self.recordSize
+        if size:
+            self.file.truncate(0)
+        return None
+
+    def restore(self, timeCounters):
+        candidates = [
+            state
+            for state in (self.readCheckpoint(), self.readLastRecord())
+            if state is not None
+        ]
+        if not candidates:
+            return False
+
+        self.sequence, values = max(candidates)
+        self.lastValues = values
+        inUse, battery, plugged, suspended = values
+        timeCounters.inUseNs = inUse * 1000000000
+        timeCounters.batteryNs = battery * 1000000000
+        timeCounters.pluggedNs = plugged * 1000000000
+        timeCounters.suspendedNs = suspended * 1000000000
+        return True
+
+    def record(self, timeCounters):
+        values = self.values(timeCounters)
+        if values != self.lastValues:
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            payload = struct.pack(
+                self.recordFormat, self.sequence, *(min(v, 0xFFFFFFFF) for v in values)
+            )
+            self.file.write(self.seal(payload))
+            self.lastValues = values
+
+        if time.monotonic() - self.lastCheckpoint >= self.checkpointInterval:
+            self.checkpoint(timeCounters)
+
+    def checkpoint(self, timeCounters):
+        values = self.values(timeCounters)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        payload = struct.pack(self.checkpointFormat, self.magic, self.sequence, *values)
+
+        tempFile = self.countersFile + ".tmp"
+        with open(tempFile, "wb") as file:
+            file.write(self.seal(payload))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tempFile, self.countersFile)
+
+        self.file.truncate(0)
+        self.lastValues = values
+        self.lastCheckpoint = time.monotonic()
+
+    def close(self, timeCounters):
+        self.checkpoint(timeCounters)
+        self.file.close()
+
+
+class BatterySampler(QObject):
+    sampleRequested = pyqtSignal()
+
+    def __init__(self, interval, worker, scheduler=None, parent=None):
+        super().__init__(parent)
+        self.interval = interval
+        self.scheduledInterval = interval
+        self.scheduler = scheduler
+        self.tickClock = TickClock()
+        self.consumers = []
+        self.sample = None
+        self.reads = 0
+        self.deliveries = 0
+        self.polledDeliveries = 0
+        self.forced = False
+
+        self.sampleRequested.connect(worker.readSample)
+        worker.sampleReady.connect(self.dispatch)
+        worker.failed.connect(self.readFailed)
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.tick)
+
+    def subscribe(self, consumer, interval=None, polled=False):
+        self.consumers.append([consumer, interval or self.interval, None, polled])
+
+    def start(self):
+        self.tick()
+
+    def tick(self, force=False):
+        self.forced = self.forced or force
+        self.sampleRequested.emit()
+
+    def dispatch(self, sample):
+        force = self.forced or (
+            self.sample is not None and sample.plugged != self.sample.plugged
+        )
+        self.forced = False
+        self.sample = sample
+        self.reads += 1
+        now = sample.monotonicNs / 1000000000
+        tolerance = self.interval / 2
+        nextInterval = self.interval
+        if self.scheduler is not None:
+            tolerance = self.scheduler.policy.minInterval / 2
+            nextInterval = self.scheduler.nextInterval(self.sample, now)
+
+        for consumer in self.consumers:
+            callback, interval, lastDelivery, polled = consumer
+            if (
+                force
+                or lastDelivery is None
+                or now - lastDelivery >= interval - tolerance
+            ):
+                consumer[2] = now
+                self.deliveries += 1
+                if polled:
+                    self.polledDeliveries += 1
+                callback(self.sample)
+
+        self.scheduledInterval = nextInterval
+        self.timer.start(self.tickClock.nextDelay(nextInterval))
+
+    def readFailed(self, name, message):
+        if name == "readSample":
+            self.scheduledInterval = self.interval
+            self.timer.start(self.tickClock.nextDelay(self.interval))
+
+    def getSavedReads(self):
+        return self.polledDeliveries - self.reads
+
+
+class PowerSupplyWatcher(QObject):
+    powerSourceChanged = pyqtSignal(bool)
+
+    netlinkKobjectUevent = 15
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.socket = None
+        self.notifier = None
+        self.plugged = self.readPlugged()
+
+    def readAttribute(self, supply, name):
+        try:
+            with open(os.path.join(self.path, supply, name), "r") as file:
+                return file.read().strip()
+        except OSError:
+            return None
+
+    def readPlugged(self):
+        try:
+            supplies = sorted(os.listdir(self.path))
+        except OSError:
+            return None
+
+        online = None
+        charging = None
+        for supply in supplies:
+            supplyType = self.readAttribute(supply, "type")
+            if supplyType == "Battery":
+                scope = self.readAttribute(supply, "scope")
+                if not SysfsBatteryBackend.isSystemBattery(supply, scope):
+                    continue
+                status = self.readAttribute(supply, "status")
+                if status is not None:
+                    charging = bool(charging) or status != "Discharging"
+            elif supplyType is not None:
+                value = self.readAttribute(supply, "online")
+                if value is not None:
+                    online = bool(online) or value == "1"
+
+        return online if online is not None else charging
+
+    def start(self):
+        if not sys.platform.startswith("linux") or self.plugged is None:
+            return False
+
+        try:
+            self.socket = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_DGRAM, self.netlinkKobjectUevent
+            )
+            self.socket.bind((0, 1))
+            self.socket.setblocking(False)
+        except (AttributeError, OSError):
+            self.socket = None
+            return False
+
+        self.notifier = QSocketNotifier(
+            self.socket.fileno(), QSocketNotifier.Read, self
+        )
+        self.notifier.activated.connect(self.readEvents)
+        return True
+
+    def stop(self):
+        if self.notifier is not None:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def readEvents(self):
+        powerSupplyEvent = False
+        while True:
+            try:
+                data = self.socket.recv(16384)
+            except (BlockingIOError, InterruptedError):
+                break
+            powerSupplyEvent = self.isPowerSupplyEvent(data) or powerSupplyEvent
+
+        if powerSupplyEvent:
+            self.check()
+
+    @staticmethod
+    def isPowerSupplyEvent(data):
+        return b"SUBSYSTEM=power_supply" in data.split(b"\0")
+
+    def check(self):
+        plugged = self.readPlugged()
+        if plugged is not None and plugged != self.plugged:
+            self.plugged = plugged
+            self.powerSourceChanged.emit(plugged)
+            return True
+        return False
+
+
+class SettingsWatcher(QObject):
+    settingsReloaded = pyqtSignal(float)
+
+    inCloseWrite = 0x00000008
+    inMovedTo = 0x00000080
+    inCreate = 0x00000100
+    inNonBlock = 0o4000
+    inCloExec = 0o2000000
+    eventHeader = struct.Struct("iIII")
+
+    def __init__(self, settingsStatus, debounceMs=250, parent=None):
+        super().__init__(parent)
+        self.settingsStatus = settingsStatus
+        self.path = os.path.abspath(settingsStatus.settingsFile)
+        self.fd = None
+        self.notifier = None
+        self.fileWatcher = None
+        self.firstEventNs = None
+        self.latency = LatencyStats()
+        self.lastLatencyMs = None
+        self.debounceTimer = QTimer(self)
+        self.debounceTimer.setSingleShot(True)
+        self.debounceTimer.setInterval(debounceMs)
+        self.debounceTimer.timeout.connect(self.reload)
+
+    def start(self):
+        if self.startInotify():
+            return "inotify"
+        self.fileWatcher = QFileSystemWatcher(self)
+        self.fileWatcher.addPath(os.path.dirname(self.path))
+        if os.path.exists(self.path):
+            self.fileWatcher.addPath(self.path)
+        self.fileWatcher.fileChanged.connect(self.changed)
+        self.fileWatcher.directoryChanged.connect(self.changed)
+        return "QFileSystemWatcher"
+
+    def startInotify(self):
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(self.inNonBlock | self.inCloExec)
+            if fd < 0:
+                return False
+            directory = os.path.dirname(self.path).encode()
+            mask = self.inCloseWrite | self.inMovedTo | self.inCreate
+            if libc.inotify_add_watch(fd, directory, mask) < 0:
+                os.close(fd)
+                return False
+        except (AttributeError, OSError):
+            return False
+
+        self.fd = fd
+        self.notifier = QSocketNotifier(self.fd, QSocketNotifier.Read, self)
+        self.notifier.activated.connect(self.readEvents)
+        return True
+
+    def stop(self):
+        self.debounceTimer.stop()
+        if self.notifier is not None:
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.fileWatcher = None
+
+    def readEvents(self):
+        name = os.path.basename(self.path).encode()
+        matched = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except (BlockingIOError, InterruptedError):
+                break
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = self.eventHeader.unpack_from(data, offset)
+                offset += self.eventHeader.size
+                eventName = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                matched = matched or eventName == name
+
+        if matched:
+            self.changed()
+
+    def changed(self, path=None):
+        if self.fileWatcher is not None and os.path.exists(self.path):
+            if self.path not in self.fileWatcher.files():
+                self.fileWatcher.addPath(self.path)
+        if self.firstEventNs is None:
+            self.firstEventNs = time.perf_counter_ns()
+        self.debounceTimer.start()
+
+    def reload(self):
+        firstEventNs = self.firstEventNs
+        self.firstEventNs = None
+        if not self.settingsStatus.reloadFile():
+            return False
+
+        elapsedNs = time.perf_counter_ns() - firstEventNs
+        self.latency.record("reload", elapsedNs)
+        self.lastLatencyMs = elapsedNs / 1000000
+        self.settingsReloaded.emit(self.lastLatencyMs)
+        return True
+
+
+class HistoryStore:
+    def __init__(self, historyFile):
+        self.historyFile = historyFile
+        self.pending = []
+        self.pendingUnits = []
+        self.pendingRollups = []
+        self.pendingPrunes = {}
+        self.commits = 0
+        self.conn = sqlite3.connect(self.historyFile, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self.batteryIds = {}
+        self.initializeHistoryTables()
+
+    def initializeHistoryTables(self):
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                time INTEGER NOT NULL,
+                percent INTEGER NOT NULL,
+                plugged INTEGER NOT NULL,
+                secsleft INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS samples_time ON samples (time);
+            CREATE TABLE IF NOT EXISTS batteries (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS battery_samples (
+                time INTEGER NOT NULL,
+                battery INTEGER NOT NULL,
+                percent INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS battery_samples_time
+                ON battery_samples (time);
+            CREATE TABLE IF NOT EXISTS rollups (
+                tier INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                minPercent INTEGER NOT NULL,
+                maxPercent INTEGER NOT NULL,
+                percentMs INTEGER NOT NULL,
+                durationMs INTEGER NOT NULL,
+                pluggedMs INTEGER NOT NULL,
+                batteryMs INTEGER NOT NULL,
+                energyUsedMwh INTEGER NOT NULL,
+                PRIMARY KEY (tier, bucket)
+            ) WITHOUT ROWID;
+            """)
+        self.conn.commit()
+
+        self.cursor.execute("SELECT id, name FROM batteries")
+        self.batteryIds = {name: id for id, name in self.cursor.fetchall()}
+
+    def getBatteryId(self, name):
+        if name not in self.batteryIds:
+            self.cursor.execute("INSERT INTO batteries (name) VALUES (?)", (name,))
+            self.batteryIds[name] = self.cursor.lastrowid
+        return self.batteryIds[name]
+
+    def append(self, sample):
+        epoch = int(sample.timestamp)
+        self.pending.append(
+            (epoch, sample.percent, int(bool(sample.plugged)), int(sample.secsleft))
+        )
+        if len(sample.batteries) > 1:
+            for unit in sample.batteries:
+                self.pendingUnits.append(
+                    (epoch, self.getBatteryId(unit.name), unit.percent)
+                )
+
+    def appendRollup(self, tier, row, retentionStart):
+        self.pendingRollups.append((tier,) + tuple(row))
+        self.pendingPrunes[tier] = retentionStart
+
+    def readRollups(self, tier, startBucket, endBucket):
+        self.flush()
+        self.cursor.execute(
+            "SELECT bucket, minPercent, maxPercent, percentMs, durationMs, "
+            "pluggedMs, batteryMs, energyUsedMwh FROM rollups "
+            "WHERE tier = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (tier, startBucket, endBucket),
+        )
+        return self.cursor.fetchall()
+
+    def flush(self):
+        if not (self.pending or self.pendingRollups):
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (tier, bucket) DO UPDATE SET "
+                "minPercent = min(minPercent, excluded.minPercent), "
+                "maxPercent = max(maxPercent, excluded.maxPercent), "
+                "percentMs = percentMs + excluded.percentMs, "
+                "durationMs = durationMs + excluded.durationMs, "
+                "pluggedMs = pluggedMs + excluded.pluggedMs, "
+                "batteryMs = batteryMs + excluded.batteryMs, "
+                "energyUsedMwh = energyUsedMwh + excluded.energyUsedMwh",
+                self.pendingRollups,
+            )
+            self.conn.executemany(
+                "DELETE FROM rollups WHERE tier = ? AND bucket < ?",
+                self.pendingPrunes.items(),
+            )
+            self.conn.executemany(
+                "INSERT INTO samples (time, percent, plugged, secsleft) "
+                "VALUES (?, ?, ?, ?)",
+                self.pending,
+            )
+            self.conn.executemany(
+                "INSERT INTO battery_samples (time, battery, percent) "
+                "VALUES (?, ?, ?)",
+                self.pendingUnits,
+            )
+        self.discardPending()
+        self.commits += 1
+
+    def discardPending(self):
+        self.pending = []
+        self.pendingUnits = []
+        self.pendingRollups = []
+        self.pendingPrunes = {}
+
+    def importSamples(self, rows):
+        self.flush()
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO samples (time, percent, plugged, secsleft) "
+                "SELECT ?, ?, ?, ? WHERE NOT EXISTS "
+                "(SELECT 1 FROM samples WHERE time = ?1)",
+                rows,
+            )
+        self.commits += 1
+        return self.conn.total_changes - before
+
+    def iterSamples(self, chunkSize=4096):
+        self.flush()
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT time, percent, plugged, secsleft FROM samples ORDER BY time, rowid"
+        )
+        while True:
+            rows = cursor.fetchmany(chunkSize)
+            if not rows:
+                break
+            yield from rows
+
+    def iterRecent(self, limit, chunkSize=4096):
+        self.flush()
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT time, percent, plugged, secsleft FROM ("
+            "SELECT time, percent, plugged, secsleft, rowid FROM samples "
+            "ORDER BY time DESC, rowid DESC LIMIT ?"
+            ") ORDER BY time, rowid",
+            (limit,),
+        )
+        while True:
+            rows = cursor.fetchmany(chunkSize)
+            if not rows:
+                break
+            yield from rows
+
+    def samples(self, start, end, chunkSize=4096):
+        self.flush()
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT time, percent, plugged, secsleft FROM samples "
+            "WHERE time >= ? AND time < ? ORDER BY time, rowid",
+            (start, end),
+        )
+        while True:
+            rows = cursor.fetchmany(chunkSize)
+            if not rows:
+                break
+            yield from rows
+
+    def aggregate(self, start, end):
+        self.flush()
+        self.cursor.execute(
+            "SELECT COUNT(*), MIN(percent), MAX(percent), SUM(percent), "
+            "SUM(plugged), MIN(time), MAX(time) FROM samples "
+            "WHERE time >= ? AND time < ?",
+            (start, end),
+        )
+        count, minimum, maximum, total, plugged, firstTime, lastTime = (
+            self.cursor.fetchone()
+        )
+        if not count:
+            return None
+        return {
+            "samples": count,
+            "minPercent": minimum,
+            "maxPercent": maximum,
+            "meanPercent": total / count,
+            "pluggedSamples": plugged,
+            "firstTime": firstTime,
+            "lastTime": lastTime,
+        }
+
+    def loadRecent(self, limit):
+        self.flush()
+        self.cursor.execute(
+            "SELECT time, percent, plugged, secsleft FROM samples "
+            "ORDER BY rowid DESC LIMIT ?",
+            (limit,),
+        )
+        records = self.cursor.fetchall()
+        records.reverse()
+        if not records:
+            return []
+
+        names = {id: name for name, id in self.batteryIds.items()}
+        units = collections.defaultdict(list)
+        self.cursor.execute(
+            "SELECT time, battery, percent FROM battery_samples "
+            "WHERE time >= ? ORDER BY rowid",
+            (records[0][0],),
+        )
+        for epoch, battery, percent in self.cursor:
+            units[epoch].append((names.get(battery, str(battery)), percent))
+
+        return [record + (tuple(units.get(record[0], ())),) for record in records]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class HistoryWriter:
+    policies = ("block", "coalesce", "dropOldest")
+
+    def __init__(
+        self, historyStore, capacity=1024, batchSize=32, maxAge=60, policy="coalesce"
+    ):
+        if policy not in self.policies:
+            raise ValueError(f"Unknown back-pressure policy: {policy}")
+        self.historyStore = historyStore
+        self.capacity = capacity
+        self.batchSize = batchSize
+        self.maxAge = maxAge
+        self.policy = policy
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.latency = LatencyStats()
+        self.maxDepth = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.commits = 0
+        self.failedCommits = 0
+        self.lastError = None
+        self.busy = False
+        self.flushRequested = False
+        self.closing = False
+        self.thread = threading.Thread(
+            target=self.run, name="HistoryWriter", daemon=True
+        )
+        self.thread.start()
+
+    def append(self, sample):
+        self.put("sample", sample)
+
+    def appendRollup(self, tier, row, retentionStart):
+        self.put("rollup", (tier, row, retentionStart))
+
+    def put(self, kind, payload):
+        item = (kind, payload, time.monotonic())
+        with self.condition:
+            if len(self.queue) >= self.capacity:
+                if not self.makeRoom(kind, item):
+                    return
+            self.queue.append(item)
+            self.maxDepth = max(self.maxDepth, len(self.queue))
+            if len(self.queue) == 1 or len(self.queue) >= self.batchSize:
+                self.condition.notify_all()
+
+    def makeRoom(self, kind, item):
+        if self.policy == "coalesce" and kind == "sample":
+            for index in range(len(self.queue) - 1, -1, -1):
+                if self.queue[index][0] == "sample":
+                    self.queue[index] = item
+                    self.coalesced += 1
+                    self.flushRequested = True
+                    self.condition.notify_all()
+                    return False
+        elif self.policy == "dropOldest":
+            for index, queued in enumerate(self.queue):
+                if queued[0] == "sample":
+                    del self.queue[index]
+                    self.dropped += 1
+                    return True
+
+        self.flushRequested = True
+        if self.policy != "block":
+            self.condition.notify_all()
+            return True
+        while len(self.queue) >= self.capacity and not self.closing:
+            self.condition.notify_all()
+            self.condition.wait()
+        return True
+
+    def isDue(self):
+        if self.closing or self.flushRequested:
+            return True
+        if len(self.queue) >= self.batchSize:
+            return True
+        return bool(self.queue) and time.monotonic() - self.queue[0][2] >= self.maxAge
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.isDue():
+                    timeout = None
+                    if self.queue:
+                        timeout = self.queue[0][2] + self.maxAge - time.monotonic()
+                    self.condition.wait(timeout)
+                if not self.queue and self.closing:
+                    return
+                items = list(self.queue)
+                self.queue.clear()
+                self.flushRequested = False
+                self.busy = True
+                self.condition.notify_all()
+
+            start = time.perf_counter_ns()
+            error = None
+            try:
+                with self.lock:
+                    for kind, payload, _ in items:
+                        if kind == "sample":
+                            self.historyStore.append(payload)
+                        else:
+                            self.historyStore.appendRollup(*payload)
+                    self.historyStore.flush()
+            except (OSError, sqlite3.Error) as commitError:
+                error = commitError
+                self.historyStore.discardPending()
+            finally:
+                self.latency.record("commit", time.perf_counter_ns() - start)
+                with self.condition:
+                    self.busy = False
+                    if error is None:
+                        self.commits += 1
+                    else:
+                        self.failedCommits += 1
+                        self.lastError = str(error)
+                    self.condition.notify_all()
+
+    def flush(self):
+        with self.condition:
+            self.flushRequested = True
+            self.condition.notify_all()
+            while self.queue or self.busy:
+                self.condition.wait()
+
+    def readRollups(self, tier, startBucket, endBucket):
+        self.flush()
+        with self.lock:
+            return self.historyStore.readRollups(tier, startBucket, endBucket)
+
+    def aggregate(self, start, end):
+        self.flush()
+        with self.lock:
+            return self.historyStore.aggregate(start, end)
+
+    def getStats(self):
+        with self.condition:
+            stats = {
+                "depth": len(self.queue),
+                "maxDepth": self.maxDepth,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "commits": self.commits,
+                "failedCommits": self.failedCommits,
+                "lastError": self.lastError,
+            }
+        stats["commitLatency"] = self.latency.getStats().get("commit")
+        return stats
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.historyStore.close()
+
+
+class RollupTier:
+    def __init__(self, tierId, name, size, retention):
+        self.tierId = tierId
+        self.name = name
+        self.size = size
+        self.retention = retention
+        self.bucket = None
+
+    def add(self, epoch, percent, plugged, elapsedMs, energyUsedMwh):
+        start = epoch - epoch % self.size
+        closed = None
+        if self.bucket is not None and self.bucket[0] != start:
+            closed = self.bucket
+            self.bucket = None
+
+        if self.bucket is None:
+            self.bucket = [start, percent, percent, 0, 0, 0, 0, 0]
+
+        bucket = self.bucket
+        bucket[1] = min(bucket[1], percent)
+        bucket[2] = max(bucket[2], percent)
+        bucket[3] += percent * elapsedMs
+        bucket[4] += elapsedMs
+        if plugged:
+            bucket[5] += elapsedMs
+        else:
+            bucket[6] += elapsedMs
+        bucket[7] += energyUsedMwh
+        return closed
+
+
+class BatteryRollups:
+    def __init__(self, historyStore, tiers, maxGap, maxBuckets):
+        self.historyStore = historyStore
+        self.tiers = [
+            RollupTier(tierId, name, size, retention)
+            for tierId, (name, size, retention) in enumerate(tiers)
+        ]
+        self.maxGapMs = maxGap * 1000
+        self.maxBuckets = maxBuckets
+        self.prevSample = None
+
+    def add(self, sample):
+        prevSample = self.prevSample
+        self.prevSample = sample
+        if prevSample is None:
+            return
+
+        elapsedMs = (sample.monotonicNs - prevSample.monotonicNs) // 1000000
+        if elapsedMs < 0 or elapsedMs > self.maxGapMs:
+            return
+
+        energyUsedMwh = 0
+        if not sample.plugged:
+            if sample.energy is not None and prevSample.energy is not None:
+                energyUsedMwh = max(
+                    0, round((prevSample.energy - sample.energy) * 1000)
+                )
+            elif sample.power is not None:
+                energyUsedMwh = round(sample.power * elapsedMs / 3600)
+
+        epoch = int(sample.timestamp)
+        for tier in self.tiers:
+            closed = tier.add(
+                epoch, sample.percent, sample.plugged, elapsedMs, energyUsedMwh
+            )
+            if closed is not None:
+                self.historyStore.appendRollup(
+                    tier.tierId, closed, epoch - tier.retention
+                )
+
+    def flush(self):
+        for tier in self.tiers:
+            if tier.bucket is not None:
+                self.historyStore.appendRollup(
+                    tier.tierId, tier.bucket, tier.bucket[0] - tier.retention
+                )
+                tier.bucket = None
+        self.historyStore.flush()
+
+    def selectTier(self, start, end):
+        latest = time.time()
+        if self.prevSample is not None:
+            latest = self.prevSample.timestamp
+        for tier in self.tiers:
+            buckets = (end - start) // tier.size
+            if buckets <= self.maxBuckets and start >= latest - tier.retention:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, start, end, tier=None):
+        tier = tier or self.selectTier(start, end)
+        startBucket = start - start % tier.size
+        rows = self.historyStore.readRollups(tier.tierId, startBucket, end)
+
+        if tier.bucket is not None and startBucket <= tier.bucket[0] < end:
+            if rows and rows[-1][0] == tier.bucket[0]:
+                rows[-1] = self.mergeRows(rows[-1], tier.bucket)
+            else:
+                rows.append(tuple(tier.bucket))
+        return tier.name, rows
+
+    @staticmethod
+    def mergeRows(row, other):
+        return (
+            row[0],
+            min(row[1], other[1]),
+            max(row[2], other[2]),
+            row[3] + other[3],
+            row[4] + other[4],
+            row[5] + other[5],
+            row[6] + other[6],
+            row[7] + other[7],
+        )
+
+    def summarize(self, start, end):
+        tierName, rows = self.query(start, end)
+        if not rows:
+            return None
+
+        total = rows[0]
+        for row in rows[1:]:
+            total = self.mergeRows(total, row)
+        return {
+            "tier": tierName,
+            "buckets": len(rows),
+            "minPercent": total[1],
+            "maxPercent": total[2],
+            "meanPercent": total[3] / total[4] if total[4] else None,
+            "pluggedSeconds": total[5] / 1000,
+            "batterySeconds": total[6] / 1000,
+            "energyUsedWh": total[7] / 1000,
+        }
+
+
+class SampleRingFile:
+    magic = b"BTRF"
+    version = 1
+    headerFormat = "<4sII"
+    headerSize = 64
+    indexOffset = 16
+    columns = (
+        ("time", "q"),
+        ("power", "i"),
+        ("secsleft", "i"),
+        ("percent", "B"),
+        ("plugged", "B"),
+    )
+
+    def __init__(self, ringFile, capacity):
+        self.ringFile = ringFile
+        self.capacity = capacity
+        self.file = None
+        self.mm = None
+        self.views = {}
+        self.open()
+
+    def fileSize(self, capacity):
+        recordSize = sum(struct.calcsize(code) for _, code in self.columns)
+        return self.headerSize + capacity * recordSize
+
+    def open(self):
+        existing = os.path.exists(self.ringFile)
+        self.file = open(self.ringFile, "r+b" if existing else "w+b")
+
+        header = self.file.read(struct.calcsize(self.headerFormat))
+        valid = False
+        if len(header) == struct.calcsize(self.headerFormat):
+            magic, version, capacity = struct.unpack(self.headerFormat, header)
+            valid = (
+                magic == self.magic
+                and version == self.version
+                and os.fstat(self.file.fileno()).st_size == self.fileSize(capacity)
+            )
+            if valid:
+                self.capacity = capacity
+
+        if not valid:
+            self.file.truncate(0)
+            self.file.truncate(self.fileSize(self.capacity))
+
+        self.mm = mmap.mmap(self.file.fileno(), self.fileSize(self.capacity))
+        if not valid:
+            struct.pack_into(
+                self.headerFormat, self.mm, 0, self.magic, self.version, self.capacity
+            )
+
+        self.index = memoryview(self.mm)[self.indexOffset : self.indexOffset + 16]
+        self.index = self.index.cast("Q")
+
+        offset = self.headerSize
+        for name, code in self.columns:
+            size = struct.calcsize(code) * self.capacity
+            self.views[name] = memoryview(self.mm)[offset : offset + size].cast(code)
+            offset += size
+
+    def getHead(self):
+        return self.index[0]
+
+    def getTail(self):
+        return self.index[1]
+
+    def __len__(self):
+        return self.index[0] - self.index[1]
+
+    def append(self, timestampMs, percent, plugged, powerMw, secsleft):
+        head = self.index[0]
+        if head - self.index[1] >= self.capacity:
+            self.index[1] = head - self.capacity + 1
+
+        slot = head % self.capacity
+        views = self.views
+        views["time"][slot] = timestampMs
+        views["power"][slot] = powerMw
+        views["secsleft"][slot] = secsleft
+        views["percent"][slot] = percent
+        views["plugged"][slot] = plugged
+
+        self.index[0] = head + 1
+
+    def appendSample(self, sample):
+        self.append(
+            int(sample.timestamp * 1000),
+            sample.percent,
+            int(bool(sample.plugged)),
+            int(sample.power * 1000) if sample.power is not None else -1,
+            max(-(2**31), min(int(sample.secsleft), 2**31 - 1)),
+        )
+
+    def segments(self, name):
+        head = self.index[0]
+        tail = self.index[1]
+        view = self.views[name]
+        start = tail % self.capacity
+        end = head % self.capacity
+        if head == tail:
+            return []
+        if start < end:
+            return [view[start:end]]
+        return [view[start:], view[:end]]
+
+    def records(self):
+        names = [name for name, _ in self.columns]
+        segments = [self.segments(name) for name in names]
+        for parts in zip(*segments):
+            yield from zip(*parts)
+
+    def newerThan(self, timestampMs):
+        head = self.index[0]
+        tail = self.index[1]
+        times = self.views["time"]
+        first = head
+        while first > tail and times[(first - 1) % self.capacity] > timestampMs:
+            first -= 1
+
+        views = [self.views[name] for name, _ in self.columns]
+        for position in range(first, head):
+            slot = position % self.capacity
+            yield tuple(view[slot] for view in views)
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.mm.flush()
+        self.index.release()
+        for view in self.views.values():
+            view.release()
+        self.views = {}
+        self.mm.close()
+        self.file.close()
+        self.mm = None
+
+
+class SampleCodec:
+    magic = b"BTSE"
+    version = 1
+
+    @staticmethod
+    def zigzag(value):
+        return (value << 1) ^ (value >> 63)
+
+    @staticmethod
+    def unzigzag(value):
+        return (value >> 1) ^ -(value & 1)
+
+    @staticmethod
+    def writeVarint(out, value):
+        while value > 0x7F:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    @staticmethod
+    def readVarint(data, pos):
+        result = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, pos
+            shift += 7
+
+
+class SampleEncoder(SampleCodec):
+    def __init__(self, blockSize=256):
+        self.blockSize = blockSize
+        self.block = []
+        self.headerWritten = False
+        self.prevTime = 0
+        self.prevDelta = 0
+        self.prevPercent = 0
+        self.prevSecsleft = 0
+        self.samples = 0
+        self.bytes = 0
+
+    def encode(self, timestamp, percent, plugged, secsleft):
+        self.block.append((timestamp, percent, plugged, secsleft))
+        if len(self.block) >= self.blockSize:
+            return self.encodeBlock()
+        return b""
+
+    def finish(self):
+        if self.block:
+            return self.encodeBlock()
+        return b""
+
+    def encodeBlock(self):
+        out = bytearray()
+        if not self.headerWritten:
+            out += self.magic
+            out.append(self.version)
+            self.headerWritten = True
+
+        block = self.block
+        self.block = []
+        writeVarint = self.writeVarint
+        zigzag = self.zigzag
+        writeVarint(out, len(block))
+
+        runs = []
+        for _, _, plugged, _ in block:
+            if runs and runs[-1][0] == plugged:
+                runs[-1][1] += 1
+            else:
+                runs.append([plugged, 1])
+        writeVarint(out, len(runs))
+        out.append(1 if runs[0][0] else 0)
+        for _, length in runs:
+            writeVarint(out, length)
+
+        prevTime = self.prevTime
+        prevDelta = self.prevDelta
+        prevPercent = self.prevPercent
+        prevSecsleft = self.prevSecsleft
+        for timestamp, percent, _, secsleft in block:
+            delta = timestamp - prevTime
+            writeVarint(out, zigzag(delta - prevDelta))
+            writeVarint(out, zigzag(percent - prevPercent))
+            writeVarint(out, zigzag(secsleft - prevSecsleft))
+            prevTime = timestamp
+            prevDelta = delta
+            prevPercent = percent
+            prevSecsleft = secsleft
+
+        self.prevTime = prevTime
+        self.prevDelta = prevDelta
+        self.prevPercent = prevPercent
+        self.prevSecsleft = prevSecsleft
+        self.samples += len(block)
+        self.bytes += len(out)
+        return bytes(out)
+
+
+class SampleDecoder(SampleCodec):
+    def __init__(self):
+        self.buffer = bytearray()
+        self.headerRead = False
+        self.prevTime = 0
+        self.prevDelta = 0
+        self.prevPercent = 0
+        self.prevSecsleft = 0
+
+    def feed(self, data):
+        self.buffer += data
+        if not self.headerRead:
+            if len(self.buffer) < len(self.magic) + 1:
+                return []
+            if bytes(self.buffer[: len(self.magic)]) != self.magic:
+                raise ValueError("Not a battery sample stream")
+            if self.buffer[len(self.magic)] != self.version:
+                raise ValueError("Unsupported battery sample stream version")
+            del self.buffer[: len(self.magic) + 1]
+            self.headerRead = True
+
+        decoded = []
+        while self.buffer:
+            try:
+                records, pos = self.decodeBlock(self.buffer)
+            except IndexError:
+                break
+            del self.buffer[:pos]
+            decoded.extend(records)
+        return decoded
+
+    def decodeBlock(self, data):
+        readVarint = self.readVarint
+        unzigzag = self.unzigzag
+        count, pos = readVarint(data, 0)
+
+        runCount, pos = readVarint(data, pos)
+        plugged = bool(data[pos])
+        pos += 1
+        statuses = []
+        for _ in range(runCount):
+            length, pos = readVarint(data, pos)
+            statuses.extend([plugged] * length)
+            plugged = not plugged
+
+        records = []
+        prevTime = self.prevTime
+        prevDelta = self.prevDelta
+        prevPercent = self.prevPercent
+        prevSecsleft = self.prevSecsleft
+        for index in range(count):
+            value, pos = readVarint(data, pos)
+            prevDelta += unzigzag(value)
+            prevTime += prevDelta
+            value, pos = readVarint(data, pos)
+            prevPercent += unzigzag(value)
+            value, pos = readVarint(data, pos)
+            prevSecsleft += unzigzag(value)
+            records.append((prevTime, prevPercent, statuses[index], prevSecsleft))
+
+        self.prevTime = prevTime
+        self.prevDelta = prevDelta
+        self.prevPercent = prevPercent
+        self.prevSecsleft = prevSecsleft
+        return records, pos
+
+
+class SampleColumns:
+    blockSize = 4096
+
+    def __init__(self, maxRows=None):
+        self.maxRows = maxRows
+        self.times = array.array("q")
+        self.percents = array.array("B")
+        self.status = bytearray()
+        self.secsleft = array.array("i")
+        self.blockTimes = array.array("q")
+        self.blockMin = array.array("B")
+        self.blockMax = array.array("B")
+        self.blockSum = array.array("Q")
+        self.blockPlugged = array.array("I")
+
+    def __len__(self):
+        return len(self.times)
+
+    def isPlugged(self, index):
+        return bool(self.status[index >> 3] & (1 << (index & 7)))
+
+    def insertionIndex(self, timestamp):
+        if not self.times or timestamp >= self.times[-1]:
+            return len(self.times)
+        return bisect.bisect_right(self.times, timestamp)
+
+    def append(self, timestamp, percent, plugged, secsleft):
+        index = self.insertionIndex(timestamp)
+        if index < len(self.times):
+            tail = [
+                (self.times[row], self.percents[row], self.isPlugged(row), secs)
+                for row, secs in enumerate(self.secsleft[index:], index)
+            ]
+            self.truncate(index)
+            self.appendRow(timestamp, percent, plugged, secsleft)
+            for row in tail:
+                self.appendRow(*row)
+        else:
+            self.appendRow(timestamp, percent, plugged, secsleft)
+        return index
+
+    def truncate(self, index):
+        del self.times[index:]
+        del self.percents[index:]
+        del self.secsleft[index:]
+        del self.status[(index + 7) >> 3 :]
+        if index & 7:
+            self.status[-1] &= (1 << (index & 7)) - 1
+
+        blocks = -(-index // self.blockSize)
+        del self.blockTimes[blocks:]
+        del self.blockMin[blocks:]
+        del self.blockMax[blocks:]
+        del self.blockSum[blocks:]
+        del self.blockPlugged[blocks:]
+        if index % self.blockSize:
+            self.rebuildBlock(blocks - 1)
+
+    def rebuildBlock(self, block):
+        low = block * self.blockSize
+        high = min(low + self.blockSize, len(self.times))
+        percents = self.percents[low:high]
+        self.blockTimes[block] = self.times[low]
+        self.blockMin[block] = min(percents)
+        self.blockMax[block] = max(percents)
+        self.blockSum[block] = sum(percents)
+        self.blockPlugged[block] = self.countPlugged(low, high)
+
+    def appendRow(self, timestamp, percent, plugged, secsleft):
+        index = len(self.times)
+        if index % self.blockSize == 0:
+            self.blockTimes.append(timestamp)
+            self.blockMin.append(percent)
+            self.blockMax.append(percent)
+            self.blockSum.append(0)
+            self.blockPlugged.append(0)
+        if index & 7 == 0:
+            self.status.append(0)
+
+        self.times.append(timestamp)
+        self.percents.append(percent)
+        self.secsleft.append(max(-(2**31), min(secsleft, 2**31 - 1)))
+
+        block = index // self.blockSize
+        self.blockMin[block] = min(self.blockMin[block], percent)
+        self.blockMax[block] = max(self.blockMax[block], percent)
+        self.blockSum[block] += percent
+        if plugged:
+            self.status[index >> 3] |= 1 << (index & 7)
+            self.blockPlugged[block] += 1
+
+    def extend(self, samples):
+        for timestamp, percent, plugged, secsleft in samples:
+            self.append(timestamp, percent, plugged, secsleft)
+
+    def clear(self):
+        self.__init__(self.maxRows)
+
+    def excessRows(self):
+        if self.maxRows is None or len(self.times) < self.maxRows + self.blockSize:
+            return 0
+        return (len(self.times) - self.maxRows) // self.blockSize * self.blockSize
+
+    def dropOldest(self, count):
+        blocks = count // self.blockSize
+        count = blocks * self.blockSize
+        if not count:
+            return 0
+        remaining = len(self.times) - count
+        del self.times[:count]
+        del self.percents[:count]
+        del self.secsleft[:count]
+        status = int.from_bytes(self.status, "little") >> count
+        self.status = bytearray(status.to_bytes((remaining + 7) >> 3, "little"))
+        del self.blockTimes[:blocks]
+        del self.blockMin[:blocks]
+        del self.blockMax[:blocks]
+        del self.blockSum[:blocks]
+        del self.blockPlugged[:blocks]
+        return count
+
+    def findIndex(self, timestamp):
+        block = max(bisect.bisect_left(self.blockTimes, timestamp) - 1, 0)
+        low = block * self.blockSize
+        high = min(low + self.blockSize, len(self.times))
+        return bisect.bisect_left(self.times, timestamp, low, high)
+
+    def rangeIndexes(self, start, end):
+        return self.findIndex(start), self.findIndex(end)
+
+    def samples(self, start, end):
+        first, last = self.rangeIndexes(start, end)
+        for index in range(first, last):
+            yield (
+                self.times[index],
+                self.percents[index],
+                self.isPlugged(index),
+                self.secsleft[index],
+            )
+
+    def countPlugged(self, first, last):
+        return sum(1 for index in range(first, last) if self.isPlugged(index))
+
+    def aggregate(self, start, end):
+        first, last = self.rangeIndexes(start, end)
+        if first >= last:
+            return None
+
+        firstBlock = -(-first // self.blockSize)
+        lastBlock = last // self.blockSize
+        if firstBlock >= lastBlock:
+            parts = [(first, last)]
+            blocks = range(0)
+        else:
+            parts = [
+                (first, firstBlock * self.blockSize),
+                (lastBlock * self.blockSize, last),
+            ]
+            blocks = range(firstBlock, lastBlock)
+
+        minimum = 255
+        maximum = 0
+        total = 0
+        plugged = 0
+        for low, high in parts:
+            if low < high:
+                values = self.percents[low:high]
+                minimum = min(minimum, min(values))
+                maximum = max(maximum, max(values))
+                total += sum(values)
+                plugged += self.countPlugged(low, high)
+        if blocks:
+            minimum = min(minimum, min(self.blockMin[blocks.start : blocks.stop]))
+            maximum = max(maximum, max(self.blockMax[blocks.start : blocks.stop]))
+            total += sum(self.blockSum[blocks.start : blocks.stop])
+            plugged += sum(self.blockPlugged[blocks.start : blocks.stop])
+
+        count = last - first
+        return {
+            "samples": count,
+            "minPercent": minimum,
+            "maxPercent": maximum,
+            "meanPercent": total / count,
+            "pluggedSamples": plugged,
+            "firstTime": self.times[first],
+            "lastTime": self.times[last - 1],
+        }
+
+
+class HistoryExporter:
+    columns = ("time", "percent", "plugged", "secsleft")
+    columnarMagic = b"BTCL"
+    columnarVersion = 1
+    formats = {".csv": "csv", ".jsonl": "jsonl", ".btc": "columnar"}
+
+    def __init__(self, chunkSize=4096):
+        self.chunkSize = chunkSize
+
+    @classmethod
+    def formatFor(cls, path):
+        return cls.formats.get(os.path.splitext(path)[1].lower(), "csv")
+
+    def chunks(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunkSize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def csvChunks(self, rows):
+        yield ",".join(self.columns) + "\n"
+        for chunk in self.chunks(rows):
+            yield "".join(
+                f"{timestamp},{percent},{int(plugged)},{secsleft}\n"
+                for timestamp, percent, plugged, secsleft in chunk
+            )
+
+    def jsonlChunks(self, rows):
+        for chunk in self.chunks(rows):
+            yield "".join(
+                json.dumps(
+                    {
+                        "time": timestamp,
+                        "percent": percent,
+                        "plugged": bool(plugged),
+                        "secsleft": secsleft,
+                    }
+                )
+                + "\n"
+                for timestamp, percent, plugged, secsleft in chunk
+            )
+
+    def columnarChunks(self, rows):
+        yield self.columnarMagic + bytes([self.columnarVersion])
+        for chunk in self.chunks(rows):
+            times, percents, plugged, secsleft = zip(*chunk)
+            times = array.array("q", times)
+            secsleft = array.array(
+                "i", (max(-(2**31), min(value, 2**31 - 1)) for value in secsleft)
+            )
+            if sys.byteorder == "big":
+                times.byteswap()
+                secsleft.byteswap()
+            yield struct.pack("<I", len(chunk))
+            yield times.tobytes()
+            yield bytes(percents)
+            yield bytes(int(value) for value in plugged)
+            yield secsleft.tobytes()
+
+    def export(self, rows, path, fileFormat=None):
+        fileFormat = fileFormat or self.formatFor(path)
+        if fileFormat == "columnar":
+            chunks = self.columnarChunks(rows)
+            mode = "wb"
+        elif fileFormat == "jsonl":
+            chunks = self.jsonlChunks(rows)
+            mode = "w"
+        else:
+            chunks = self.csvChunks(rows)
+            mode = "w"
+
+        written = 0
+        with open(path, mode) as file:
+            for chunk in chunks:
+                file.write(chunk)
+                written += len(chunk)
+        return written
+
+    @classmethod
+    def readColumnar(cls, path):
+        with open(path, "rb") as file:
+            header = file.read(len(cls.columnarMagic) + 1)
+            if header[:-1] != cls.columnarMagic:
+                raise ValueError("Not a columnar battery history file")
+
+            while True:
+                countBytes = file.read(4)
+                if not countBytes:
+                    break
+                (count,) = struct.unpack("<I", countBytes)
+                times = array.array("q")
+                times.frombytes(file.read(8 * count))
+                percents = file.read(count)
+                plugged = file.read(count)
+                secsleft = array.array("i")
+                secsleft.frombytes(file.read(4 * count))
+                if sys.byteorder == "big":
+                    times.byteswap()
+                    secsleft.byteswap()
+                for index in range(count):
+                    yield (
+                        times[index],
+                        percents[index],
+                        bool(plugged[index]),
+                        secsleft[index],
+                    )
+
+
+class BatteryReportHtmlParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.cells = {}
+        self.cellClass = None
+        self.spanClass = None
+        self.lastDate = ""
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get("class") or "").split()
+        if tag == "tr":
+            self.cells = {}
+        elif tag == "td":
+            self.cellClass = classes[0] if classes else None
+            if self.cellClass:
+                self.cells.setdefault(self.cellClass, "")
+        elif tag == "span" and self.cellClass == "dateTime":
+            self.spanClass = classes[0] if classes else None
+
+    def handle_endtag(self, tag):
+        if tag == "td":
+            self.cellClass = None
+        elif tag == "span":
+            self.spanClass = None
+        elif tag == "tr":
+            self.finishRow()
+
+    def handle_data(self, data):
+        if self.cellClass is None:
+            return
+        if self.spanClass == "date" and data.strip():
+            self.lastDate = data.strip()
+        elif self.spanClass != "date":
+            self.cells[self.cellClass] += data
+
+    def finishRow(self):
+        cells = self.cells
+        self.cells = {}
+        if not {"dateTime", "acdc", "percent"} <= cells.keys():
+            return
+        percent = "".join(char for char in cells["percent"] if char.isdigit())
+        if not percent or not self.lastDate:
+            return
+        try:
+            stamp = datetime.datetime.strptime(
+                f"{self.lastDate} {cells['dateTime'].strip()}", "%Y-%m-%d %H:%M:%S"
+            )
+        except ValueError:
+            return
+        self.rows.append(
+            (
+                "report",
+                int(stamp.timestamp()),
+                min(int(percent), 100),
+                cells["acdc"].strip().upper() == "AC",
+                None,
+            )
+        )
+
+
+class BatteryReportImporter:
+    upowerPluggedStates = {"charging", "fully-charged", "pending-charge"}
+    readSize = 64 * 1024
+    spoolRecord = struct.Struct("<qbBd")
+
+    def __init__(self, historyStore, workers=None):
+        self.historyStore = historyStore
+        self.workers = workers
+
+    @classmethod
+    def expandPaths(cls, paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if cls.fileKind(name):
+                        yield os.path.join(path, name)
+            else:
+                yield path
+
+    @staticmethod
+    def fileKind(path):
+        name = os.path.basename(path).lower()
+        if name.startswith(("history-charge-", "history-rate-")) and name.endswith(
+            ".dat"
+        ):
+            return "upower"
+        if name.endswith(".xml"):
+            return "xml"
+        if name.endswith((".html", ".htm")):
+            return "html"
+        return None
+
+    @classmethod
+    def parseUpower(cls, path):
+        name = os.path.basename(path)[: -len(".dat")]
+        kind, device = name[len("history-") :].split("-", 1)
+        with open(path) as file:
+            for line in file:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                try:
+                    timestamp = int(fields[0])
+                    value = float(fields[1])
+                except ValueError:
+                    continue
+                plugged = fields[2] in cls.upowerPluggedStates
+                if kind == "charge":
+                    yield device, timestamp, min(round(value), 100), plugged, None
+                else:
+                    yield device, timestamp, None, plugged, value
+
+    @staticmethod
+    def parseXml(path):
+        for _, element in ElementTree.iterparse(path):
+            if element.tag.rsplit("}", 1)[-1] != "UsageEntry":
+                continue
+            full = float(element.get("FullChargeCapacity") or 0)
+            charge = element.get("ChargeCapacity")
+            stamp = element.get("Timestamp")
+            plugged = element.get("Ac") == "1"
+            element.clear()
+            if not full or charge is None or not stamp:
+                continue
+            stamp = datetime.datetime.fromisoformat(stamp.rstrip("Z")[:19])
+            yield (
+                "report",
+                int(stamp.replace(tzinfo=datetime.timezone.utc).timestamp()),
+                min(round(float(charge) / full * 100), 100),
+                plugged,
+                None,
+            )
+
+    @classmethod
+    def parseHtml(cls, path):
+        parser = BatteryReportHtmlParser()
+        with open(path, encoding="utf-8", errors="replace") as file:
+            while True:
+                data = file.read(cls.readSize)
+                if not data:
+                    break
+                parser.feed(data)
+                yield from parser.rows
+                parser.rows = []
+        parser.close()
+        yield from parser.rows
+
+    @classmethod
+    def parseFile(cls, path):
+        kind = cls.fileKind(path)
+        if kind == "upower":
+            return cls.parseUpower(path)
+        if kind == "xml":
+            return cls.parseXml(path)
+        if kind == "html":
+            return cls.parseHtml(path)
+        raise ValueError(f"Unsupported battery report: {path}")
+
+    @classmethod
+    def spoolFile(cls, path, spoolDir):
+        fd, spoolPath = tempfile.mkstemp(suffix=".rec", dir=spoolDir)
+        chunk = bytearray()
+        lastTime = None
+        with os.fdopen(fd, "wb") as spool:
+            for _, timestamp, percent, plugged, power in cls.parseFile(path):
+                if lastTime is not None and timestamp < lastTime:
+                    continue
+                lastTime = timestamp
+                chunk += cls.spoolRecord.pack(
+                    timestamp,
+                    -1 if percent is None else percent,
+                    plugged,
+                    math.nan if power is None else power,
+                )
+                if len(chunk) >= cls.readSize:
+                    spool.write(chunk)
+                    chunk = bytearray()
+            spool.write(chunk)
+        return spoolPath
+
+    @classmethod
+    def readSpool(cls, spoolPath, device):
+        chunkSize = cls.readSize // cls.spoolRecord.size * cls.spoolRecord.size
+        with open(spoolPath, "rb") as spool:
+            while True:
+                chunk = spool.read(chunkSize)
+                if not chunk:
+                    break
+                for timestamp, percent, plugged, power in cls.spoolRecord.iter_unpack(
+                    chunk
+                ):
+                    yield (
+                        device,
+                        timestamp,
+                        None if percent < 0 else percent,
+                        bool(plugged),
+                        None if math.isnan(power) else power,
+                    )
+
+    @classmethod
+    def deviceFor(cls, path):
+        if cls.fileKind(path) != "upower":
+            return "report"
+        name = os.path.basename(path)[: -len(".dat")]
+        return name[len("history-") :].split("-", 1)[1]
+
+    @staticmethod
+    def energyFull(device):
+        parts = device.split("-")
+        if len(parts) >= 3:
+            try:
+                return float(parts[-2])
+            except ValueError:
+                pass
+        return None
+
+    def merge(self, recordLists):
+        percents = {}
+        powers = {}
+        for device, timestamp, percent, plugged, power in heapq.merge(
+            *recordLists, key=lambda record: record[1]
+        ):
+            if power is not None:
+                powers[device] = power
+                continue
+            percents[device] = percent
+
+            energies = [self.energyFull(name) for name in percents]
+            if None in energies:
+                combined = sum(percents.values()) / len(percents)
+                energyNow = None
+            else:
+                energyNow = sum(
+                    level / 100 * energy
+                    for level, energy in zip(percents.values(), energies)
+                )
+                combined = energyNow / sum(energies) * 100
+
+            if plugged:
+                secsleft = psutil.POWER_TIME_UNLIMITED
+            elif energyNow is not None and all(name in powers for name in percents):
+                drain = sum(powers[name] for name in percents)
+                secsleft = (
+                    int(energyNow / drain * 3600)
+                    if drain
+                    else psutil.POWER_TIME_UNKNOWN
+                )
+            else:
+                secsleft = psutil.POWER_TIME_UNKNOWN
+
+            yield timestamp, round(combined), int(plugged), secsleft
+
+    def importFiles(self, paths):
+        paths = list(self.expandPaths(paths))
+        with tempfile.TemporaryDirectory(prefix="battery-import-") as spoolDir:
+            with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+                spoolPaths = list(
+                    executor.map(self.spoolFile, paths, [spoolDir] * len(paths))
+                )
+
+            upowerStreams = []
+            streams = []
+            for path, spoolPath in zip(paths, spoolPaths):
+                records = self.readSpool(spoolPath, self.deviceFor(path))
+                if self.fileKind(path) == "upower":
+                    upowerStreams.append(records)
+                else:
+                    streams.append(self.merge([records]))
+            if upowerStreams:
+                streams.append(self.merge(upowerStreams))
+
+            return self.historyStore.importSamples(
+                heapq.merge(*streams, key=lambda row: row[0])
+            )
+
+
+class BatteryRecordModel(QAbstractTableModel):
+    headers = ["Time", "Percentage", "Status", "Remaining"]
+
+    def __init__(self, historyColumns, formatRemaining, parent=None):
+        super().__init__(parent)
+        self.historyColumns = historyColumns
+        self.formatRemaining = formatRemaining
+        self.firstRow = 0
+        self.unitLabels = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.historyColumns) - self.firstRow
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.formatCell(self.firstRow + index.row(), index.column())
+
+    def formatCell(self, row, column):
+        historyColumns = self.historyColumns
+        if column == 0:
+            timestamp = historyColumns.times[row]
+            return datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M")
+        if column == 1:
+            percentText = f"{historyColumns.percents[row]}%"
+            if self.unitLabels:
+                label = self.unitLabels.get(historyColumns.times[row])
+                if label:
+                    percentText += f" ({label})"
+            return percentText
+        plugged = historyColumns.isPlugged(row)
+        if column == 2:
+            return "Plugged" if plugged else "Unplugged"
+        return self.formatRemaining(
+            historyColumns.percents[row], plugged, historyColumns.secsleft[row]
+        )
+
+    def columnCandidates(self):
+        historyColumns = self.historyColumns
+        first = self.firstRow
+        last = len(historyColumns) - 1
+        if first > last:
+            return [[] for _ in self.headers]
+
+        maxPercent = max(historyColumns.percents[first:])
+        secsleft = historyColumns.secsleft[first:]
+        return [
+            [self.formatCell(first, 0), self.formatCell(last, 0)],
+            [f"{maxPercent}%"]
+            + [f"{maxPercent}% ({label})" for label in self.unitLabels.values()],
+            ["Plugged", "Unplugged"],
+            [
+                self.formatRemaining(100, True, 0),
+                self.formatRemaining(100, False, 0),
+                self.formatRemaining(0, False, min(secsleft)),
+                self.formatRemaining(0, False, max(secsleft)),
+            ],
+        ]
+
+    def append(self, timestamp, percent, plugged, secsleft, batteries=()):
+        if len(batteries) > 1:
+            self.unitLabels[timestamp] = " / ".join(
+                f"{name} {level}%" for name, level in batteries
+            )
+
+        row = self.historyColumns.insertionIndex(timestamp) - self.firstRow
+        if row < 0:
+            self.historyColumns.append(timestamp, percent, plugged, secsleft)
+            self.firstRow += 1
+            self.trim()
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.historyColumns.append(timestamp, percent, plugged, secsleft)
+        self.endInsertRows()
+        self.trim()
+
+    def trim(self):
+        historyColumns = self.historyColumns
+        count = historyColumns.excessRows()
+        if not count:
+            return
+        visible = count - self.firstRow
+        if visible > 0:
+            self.beginRemoveRows(QModelIndex(), 0, visible - 1)
+        historyColumns.dropOldest(count)
+        self.firstRow = max(self.firstRow - count, 0)
+        if visible > 0:
+            self.endRemoveRows()
+        if self.unitLabels and historyColumns.times:
+            oldest = historyColumns.times[0]
+            self.unitLabels = {
+                timestamp: label
+                for timestamp, label in self.unitLabels.items()
+                if timestamp >= oldest
+            }
+
+    def extend(self, samples):
+        self.beginResetModel()
+        self.historyColumns.extend(samples)
+        self.historyColumns.dropOldest(self.historyColumns.excessRows())
+        self.endResetModel()
+
+    def reset(self):
+        self.beginResetModel()
+        self.firstRow = len(self.historyColumns)
+        self.unitLabels.clear()
+        self.endResetModel()
+
+    def bytesPerRow(self):
+        historyColumns = self.historyColumns
+        rows = len(historyColumns)
+        if not rows:
+            return 0.0
+        arrays = (
+            historyColumns.times,
+            historyColumns.percents,
+            historyColumns.secsleft,
+            historyColumns.blockTimes,
+            historyColumns.blockMin,
+            historyColumns.blockMax,
+            historyColumns.blockSum,
+            historyColumns.blockPlugged,
+        )
+        total = sum(len(column) * column.itemsize for column in arrays)
+        return (total + len(historyColumns.status)) / rows
+
+
+class CustomTableView(QTableView):
+    def __init__(self):
+        super().__init__()
+        self.columnWidths = []
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.resizeEvent = self.customResizeEvent
 
-    def customResizeEvent(self, event):
-        self.resizeColumnsToContents()
+    def setModel(self, model):
+        super().setModel(model)
+        model.rowsInserted.connect(self.rowsAppended)
+        model.modelReset.connect(self.recomputeColumnWidths)
+        self.recomputeColumnWidths()
+
+    def cellWidth(self, text):
+        margin = self.style().pixelMetric(QStyle.PM_FocusFrameHMargin, None, self) + 1
+        return self.fontMetrics().horizontalAdvance(text) + 2 * margin + 1
+
+    def recomputeColumnWidths(self):
         header = self.horizontalHeader()
-        table_width = self.viewport().width()
-        total_width = header.length()
-        if total_width < table_width:
+        self.columnWidths = [
+            max(
+                [header.sectionSizeHint(column)]
+                + [self.cellWidth(text) for text in candidates]
+            )
+            for column, candidates in enumerate(self.model().columnCandidates())
+        ]
+        self.applyColumnWidths()
+
+    def rowsAppended(self, parent, first, last):
+        model = self.model()
+        grown = False
+        for column, width in enumerate(self.columnWidths):
+            for row in range(first, last + 1):
+                cellWidth = self.cellWidth(model.index(row, column).data())
+                if cellWidth > width:
+                    width = cellWidth
+                    grown = True
+            self.columnWidths[column] = width
+        if grown:
+            self.applyColumnWidths()
+
+    def applyColumnWidths(self):
+        header = self.horizontalHeader()
+        if sum(self.columnWidths) < self.viewport().width():
             header.setSectionResizeMode(QHeaderView.Stretch)
         else:
             header.setSectionResizeMode(QHeaderView.Interactive)
+            for column, width in enumerate(self.columnWidths):
+                self.setColumnWidth(column, width)
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.FontChange and self.model() is not None:
+            self.recomputeColumnWidths()
+        return super().changeEvent(event)
 
+    def customResizeEvent(self, event):
+        self.applyColumnWidths()
         return super().resizeEvent(event)
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    brightnessRequested = pyqtSignal(int)
+    soundRequested = pyqtSignal(str)
+    exportFinished = pyqtSignal(str)
+
+    def __init__(
+        self,
+        sensorBackend=None,
+        threaded=True,
+        historyFile=None,
+        ringFile=None,
+        countersFile=None,
+        countersJournalFile=None,
+        settingsFile=None,
+    ):
         super().__init__()
 
         self.entities = Entities()
 
-        self.settingsStatus = SettingsStatus()
+        if settingsFile is not None:
+            SettingsStatus.sharedInstance = SettingsStatus(settingsFile)
+        self.settingsStatus = SettingsStatus.shared()
+        self.currentSettings = self.settingsStatus.values()
+        self.settingsStatus.settingChanged.connect(self.settingChanged)
+        self.settingsWatcher = SettingsWatcher(
+            self.settingsStatus, self.entities.settingsDebounceMs, self
+        )
+        self.settingsWatcher.start()
 
         self.close_on_exit = False
 
-        self.prevPercent = None
+        self.prevLevels = None
         self.timeZero = "0:00:00"
         self.percentZero = "0%"
         self.batteryRemaining = None
 
-        self.startTime = datetime.datetime.now()
-        self.totalInUseTime = datetime.timedelta()
-        self.totalBatteryTime = datetime.timedelta()
-        self.totalPluggedInTime = datetime.timedelta()
+        self.timeCounters = TimeCounters(
+            self.entities.suspendGapFactor, self.entities.suspendMinGap
+        )
+        self.counterJournal = CounterJournal(
+            countersFile or self.entities.countersFile,
+            countersJournalFile or self.entities.countersJournalFile,
+            self.entities.countersCheckpointInterval,
+        )
+        self.counterJournal.restore(self.timeCounters)
+
+        self.pollScheduler = AdaptivePollScheduler(
+            PollingPolicy.fromEntities(self.entities)
+        )
+        if sensorBackend is None:
+            sensorBackend = LiveSensorBackend(
+                openBatteryBackend(self.entities.powerSupplyPath)
+            )
+        self.sensorBackend = sensorBackend
+
+        self.sensorWorker = SensorWorker(self.sensorBackend)
+        self.sensorThread = None
+        if threaded:
+            self.sensorThread = QThread(self)
+            self.sensorWorker.moveToThread(self.sensorThread)
+            self.sensorThread.start()
+        self.brightnessRequested.connect(self.sensorWorker.setBrightness)
+        self.soundRequested.connect(self.sensorWorker.playSound)
+
+        self.batterySampler = BatterySampler(
+            self.entities.samplerInterval,
+            self.sensorWorker,
+            self.pollScheduler,
+            self,
+        )
+        self.batterySampler.subscribe(
+            self.updateStatus, self.entities.statusInterval, polled=True
+        )
+        self.batterySampler.subscribe(self.updateTimes, polled=True)
+        self.batterySampler.subscribe(self.updateBattery, polled=True)
+
+        self.powerSupplyWatcher = PowerSupplyWatcher(
+            self.entities.powerSupplyPath, self
+        )
+        self.powerSupplyWatcher.powerSourceChanged.connect(self.powerSourceChanged)
+
+        self.historyStore = HistoryStore(historyFile or self.entities.historyFile)
+
+        self.historyWriter = HistoryWriter(
+            self.historyStore,
+            self.entities.historyQueueCapacity,
+            self.entities.historyBatchSize,
+            self.entities.historyMaxAge,
+            self.entities.historyQueuePolicy,
+        )
+        self.exportThread = None
+        self.exportFinished.connect(self.historyExported)
+
+        self.historyColumns = SampleColumns(self.entities.historyWindowSize)
+
+        self.batteryRollups = BatteryRollups(
+            self.historyWriter,
+            self.entities.rollupTiers,
+            self.entities.rollupMaxGap,
+            self.entities.rollupMaxBuckets,
+        )
+        self.batterySampler.subscribe(self.batteryRollups.add)
+
+        self.sampleRing = None
+        if ringFile is not False:
+            self.sampleRing = SampleRingFile(
+                ringFile or self.entities.ringFile, self.entities.ringCapacity
+            )
+            self.batterySampler.subscribe(self.sampleRing.appendSample)
 
         self.initUI()
-        self.updateStatus()
-        self.updateTimes()
-        self.updateBattery()
+        self.loadHistory()
+        self.batterySampler.start()
+        self.powerSupplyWatcher.start()
 
     def initUI(self):
         self.setWindowTitle(self.entities.mainWindowName)
@@ -235,6 +3335,11 @@ class MainWindow(QMainWindow):
         settingsAction.triggered.connect(self.settings)
         appMenu.addAction(settingsAction)
 
+        exportAction = QAction("Export History", self)
+        exportAction.setShortcut("Ctrl+H")
+        exportAction.triggered.connect(self.exportHistory)
+        appMenu.addAction(exportAction)
+
         appMenu.addSeparator()
 
         exitAction = QAction("Exit", self)
@@ -345,11 +3450,11 @@ class MainWindow(QMainWindow):
 
         self.trayIcon.show()
 
-        self.tableWidget = CustomTableWidget()
-        self.tableWidget.setColumnCount(4)
-        self.tableWidget.setHorizontalHeaderLabels(
-            ["Time", "Percentage", "Status", "Remaining"]
+        self.batteryRecordModel = BatteryRecordModel(
+            self.historyColumns, self.formatRemaining, self
         )
+        self.tableWidget = CustomTableView()
+        self.tableWidget.setModel(self.batteryRecordModel)
         self.tableWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
 
         batteryRecordGroupbox = QGroupBox("Battery Record")
@@ -365,6 +3470,9 @@ class MainWindow(QMainWindow):
         totalInUseLabel = QLabel("Total in use time:")
         self.totalInUseTimeLabel = QLabel(self.timeZero)
 
+        suspendedLabel = QLabel("Suspended time:")
+        self.suspendedTimeLabel = QLabel(self.timeZero)
+
         batteryRemainingLabel = QLabel("Remaining Battery Time:")
         self.batteryRemainingTimeLabel = QLabel(self.timeZero)
 
@@ -384,6 +3492,7 @@ class MainWindow(QMainWindow):
         batteryInfoLayout.addRow(batteryLabel, self.batteryTimeLabel)
         batteryInfoLayout.addRow(pluggedInLabel, self.pluggedInTimeLabel)
         batteryInfoLayout.addRow(totalInUseLabel, self.totalInUseTimeLabel)
+        batteryInfoLayout.addRow(suspendedLabel, self.suspendedTimeLabel)
         batteryInfoLayout.addRow(batteryRemainingLabel, self.batteryRemainingTimeLabel)
         batteryInfoLayout.addRow(batteryLevelLabel, self.batteryLevelPercentLabel)
         batteryInfoLayout.addRow(brightnessLevelLabel, self.brightnessLevelPercentLabel)
@@ -399,11 +3508,9 @@ class MainWindow(QMainWindow):
 
     def batteryCareOn(self):
         self.settingsStatus.setBatteryCare(True)
-        self.settingsStatus.saveSettings()
 
     def batteryCareOff(self):
         self.settingsStatus.setBatteryCare(False)
-        self.settingsStatus.saveSettings()
 
     def manual(self):
         self.manualWindow = ManualWindow()
@@ -418,37 +3525,38 @@ class MainWindow(QMainWindow):
     def updateBrightness(self):
         brightnessLevel = self.brightnessSlider.value()
         self.brightnessLevelPercentLabel.setText(f"{brightnessLevel}%")
-        self.setBrightnessLevel(brightnessLevel)
-
-    def setBrightnessLevel(self, level):
-        c = wmi.WMI(namespace="wmi")
-        methods = c.WmiMonitorBrightnessMethods()[0]
-        methods.WmiSetBrightness(level, 0)
-
-    def getBrightnessLevel(self):
-        c = wmi.WMI(namespace="wmi")
-        currentLevel = c.WmiMonitorBrightness()[0].CurrentBrightness
-        return currentLevel
+        self.brightnessRequested.emit(brightnessLevel)
 
-    def formatTime(self, seconds):
+    @staticmethod
+    def formatTime(seconds):
         hours = seconds // 3600
         minutes = (seconds % 3600) // 60
         return f"{hours} H : {minutes} Min"
 
+    @staticmethod
+    def formatRemaining(percent, plugged, secsleft):
+        if plugged:
+            return "Charging"
+        if percent == 100:
+            return "Fully Charged"
+        return MainWindow.formatTime(secsleft)
+
     def totalTimeReset(self):
-        self.totalInUseTime = datetime.timedelta()
+        self.timeCounters.inUseNs = 0
+        self.timeCounters.suspendedNs = 0
         self.totalInUseTimeLabel.setText(self.timeZero)
+        self.suspendedTimeLabel.setText(self.timeZero)
 
     def totalBatteryTimeReset(self):
-        self.totalBatteryTime = datetime.timedelta()
+        self.timeCounters.batteryNs = 0
         self.batteryTimeLabel.setText(self.timeZero)
 
     def totalPluggedInTimeReset(self):
-        self.totalPluggedInTime = datetime.timedelta()
+        self.timeCounters.pluggedNs = 0
         self.pluggedInTimeLabel.setText(self.timeZero)
 
     def tableWidgetReset(self):
-        self.tableWidget.setRowCount(0)
+        self.batteryRecordModel.reset()
 
     def allReset(self):
         self.totalTimeReset()
@@ -456,6 +3564,46 @@ class MainWindow(QMainWindow):
         self.totalPluggedInTimeReset()
         self.tableWidgetReset()
 
+    def exportHistory(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Export History",
+            "battery-history.csv",
+            "CSV (*.csv);;JSON Lines (*.jsonl);;Columnar (*.btc)",
+        )
+        if not path:
+            return
+        if self.exportThread is not None and self.exportThread.is_alive():
+            QMessageBox.information(self, "Export", "An export is already running.")
+            return
+
+        self.exportThread = threading.Thread(
+            target=self.runExport, args=(path,), name="HistoryExport", daemon=True
+        )
+        self.exportThread.start()
+
+    def runExport(self, path):
+        try:
+            self.historyWriter.flush()
+            historyStore = HistoryStore(self.historyStore.historyFile)
+            try:
+                HistoryExporter().export(historyStore.iterSamples(), path)
+            finally:
+                historyStore.close()
+        except (OSError, sqlite3.Error) as error:
+            self.exportFinished.emit(str(error))
+            return
+        self.exportFinished.emit("")
+
+    def historyExported(self, error):
+        if error:
+            QMessageBox.warning(self, "Export", f"Export failed: {error}")
+            return
+
+        QMessageBox.information(
+            self, "Export", "The battery history has been successfully exported."
+        )
+
     def aboutMessageBox(self):
         aboutText = f"""Battery Tracker: Monitor and optimize your Windows battery life with real-time updates, usage stats, and helpful notifications.
         \nVersion: {self.entities.appVersion}
@@ -464,8 +3612,13 @@ class MainWindow(QMainWindow):
         \nContact: Sparky#2273 on Discord or Sparky2273 on Telegram"""
         QMessageBox.about(self, "About", aboutText)
 
+    def settingChanged(self, key, value):
+        self.currentSettings[key] = value
+        if key == "batteryCare" and value and self.batterySampler.sample is not None:
+            self.updateStatus(self.batterySampler.sample)
+
     def showNotification(self, status):
-        if self.settingsStatus.getBatteryCareNotif():
+        if self.currentSettings["batteryCareNotif"]:
             if status == "Plugg":
                 self.trayIcon.showMessage(
                     "Plugged In",
@@ -479,108 +3632,127 @@ class MainWindow(QMainWindow):
                     QSystemTrayIcon.Warning,
                 )
 
-    def updateStatus(self):
-        if self.settingsStatus.getBatteryCare():
-            battery = psutil.sensors_battery()
-            percent = battery.percent
-            plugged = battery.power_plugged
-
-            if percent < 21 and not plugged:
-                pluggSoundFile = self.entities.pluggSound
-                pygame.mixer.init()
-                pygame.mixer.music.load(pluggSoundFile)
-                pygame.mixer.music.play()
+    def updateStatus(self, sample):
+        if self.currentSettings["batteryCare"]:
+            percent = sample.percent
+            plugged = sample.plugged
+
+            if percent < self.entities.batteryCareLowThreshold and not plugged:
+                self.soundRequested.emit(self.entities.pluggSound)
                 self.showNotification("Plugg")
 
-            elif percent > 80 and plugged:
-                unpluggSoundFile = self.entities.unpluggSound
-                pygame.mixer.init()
-                pygame.mixer.music.load(unpluggSoundFile)
-                pygame.mixer.music.play()
+            elif percent > self.entities.batteryCareHighThreshold and plugged:
+                self.soundRequested.emit(self.entities.unpluggSound)
                 self.showNotification("UnPlugg")
 
-        QTimer.singleShot(2 * 1000, self.updateStatus)
+    def powerSourceChanged(self, plugged):
+        self.batterySampler.tick(force=True)
 
-    def updateTimes(self):
-        battery = psutil.sensors_battery()
-        percent = battery.percent
-        plugged = battery.power_plugged
+    def updateTimes(self, sample):
+        percent = sample.percent
+        plugged = sample.plugged
 
-        if plugged:
-            self.batteryRemaining = "Charging"
-            self.batteryRemainingTimeLabel.setText("Charging")
-        else:
-            if percent == 100:
-                self.batteryRemaining = "Fully Charged"
-                self.batteryRemainingTimeLabel.setText("Fully Charged")
-            else:
-                self.batteryRemaining = self.formatTime(battery.secsleft)
-                self.batteryRemainingTimeLabel.setText(self.batteryRemaining)
+        self.batteryRemaining = self.formatRemaining(percent, plugged, sample.secsleft)
+        self.batteryRemainingTimeLabel.setText(self.batteryRemaining)
 
-        brightnessLevel = self.getBrightnessLevel()
-        self.brightnessSlider.setValue(brightnessLevel)
+        brightnessLevel = sample.brightness
+        if brightnessLevel is not None:
+            self.brightnessSlider.setValue(brightnessLevel)
+            self.brightnessLevelPercentLabel.setText(f"{brightnessLevel}%")
 
         self.batteryLevelPercentLabel.setText(f"{percent}%")
-        self.brightnessLevelPercentLabel.setText(f"{brightnessLevel}%")
 
-        currentTime = datetime.datetime.now()
-        elapsedTime = currentTime - self.startTime
+        timeCounters = self.timeCounters
+        timeCounters.accumulate(
+            sample.monotonicNs,
+            plugged,
+            sample.boottimeNs,
+            int(self.batterySampler.scheduledInterval * 1000000000),
+        )
+
+        self.counterJournal.record(timeCounters)
+
+        timeFormat = timeCounters.format(timeCounters.inUseNs)
+        self.totalInUseTimeLabel.setText(timeFormat)
 
-        self.totalInUseTime += elapsedTime
-        timeFormat = str(self.totalInUseTime).split(".")[0]
-        self.totalInUseTimeLabel.setText(str(timeFormat))
+        timeFormat = timeCounters.format(timeCounters.suspendedNs)
+        self.suspendedTimeLabel.setText(timeFormat)
 
-        if psutil.sensors_battery().power_plugged:
-            self.totalPluggedInTime += elapsedTime
-            timeFormat = str(self.totalPluggedInTime).split(".")[0]
-            self.pluggedInTimeLabel.setText(str(timeFormat))
+        if plugged:
+            timeFormat = timeCounters.format(timeCounters.pluggedNs)
+            self.pluggedInTimeLabel.setText(timeFormat)
 
-            if self.settingsStatus.getResetTimesAfterBatteryStatusChsnged():
+            if self.currentSettings["resetTimesAfterBatteryStatusChsnged"]:
                 if not str(self.batteryTimeLabel.textFormat()) == self.timeZero:
                     self.totalBatteryTimeReset()
 
         else:
-            self.totalBatteryTime += elapsedTime
-            timeFormat = str(self.totalBatteryTime).split(".")[0]
-            self.batteryTimeLabel.setText(str(timeFormat))
+            timeFormat = timeCounters.format(timeCounters.batteryNs)
+            self.batteryTimeLabel.setText(timeFormat)
 
-            if self.settingsStatus.getResetTimesAfterBatteryStatusChsnged():
+            if self.currentSettings["resetTimesAfterBatteryStatusChsnged"]:
                 if not str(self.pluggedInTimeLabel.textFormat()) == self.timeZero:
                     self.totalPluggedInTimeReset()
 
-        self.startTime = currentTime
-
-        QTimer.singleShot(1 * 1000, self.updateTimes)
-
-    def updateBattery(self):
-        battery = psutil.sensors_battery()
-        percent = battery.percent
-        plugged = battery.power_plugged
-        currentTime = QTime.currentTime().toString("HH:mm")
-
-        if percent != self.prevPercent:
-            rowPosition = self.tableWidget.rowCount()
-            self.tableWidget.insertRow(rowPosition)
-
-            timeItem = QTableWidgetItem(currentTime)
-            timeItem.setTextAlignment(Qt.AlignCenter)
-            self.tableWidget.setItem(rowPosition, 0, timeItem)
-
-            percentItem = QTableWidgetItem(str(percent) + "%")
-            percentItem.setTextAlignment(Qt.AlignCenter)
-            self.tableWidget.setItem(rowPosition, 1, percentItem)
-
-            statusItem = QTableWidgetItem("Plugged" if plugged else "Unplugged")
-            statusItem.setTextAlignment(Qt.AlignCenter)
-            self.tableWidget.setItem(rowPosition, 2, statusItem)
-
-            remainingItem = QTableWidgetItem(self.batteryRemaining)
-            remainingItem.setTextAlignment(Qt.AlignCenter)
-            self.tableWidget.setItem(rowPosition, 3, remainingItem)
+    def loadHistory(self):
+        self.batteryRecordModel.extend(
+            self.historyStore.iterRecent(self.entities.historyWindowSize)
+        )
 
-            self.prevPercent = percent
+        records = self.historyStore.loadRecent(self.entities.historyReloadLimit)
+        for timestamp, _, _, _, batteries in records:
+            if len(batteries) > 1:
+                self.batteryRecordModel.unitLabels[timestamp] = " / ".join(
+                    f"{name} {level}%" for name, level in batteries
+                )
 
-        QTimer.singleShot(1 * 1000, self.updateBattery)
+        if self.sampleRing is not None:
+            self.recoverRingSamples()
+
+    def recoverRingSamples(self):
+        historyColumns = self.historyColumns
+        lastTime = -(2**62)
+        prevPercent = None
+        if len(historyColumns):
+            lastTime = historyColumns.times[-1]
+            prevPercent = historyColumns.percents[-1]
+
+        for timestampMs, power, secsleft, percent, plugged in self.sampleRing.newerThan(
+            lastTime * 1000 + 999
+        ):
+            if percent == prevPercent:
+                continue
+            prevPercent = percent
+            sample = BatterySample(
+                timestampMs / 1000,
+                None,
+                None,
+                percent,
+                bool(plugged),
+                secsleft,
+                None,
+                (),
+                None,
+                power / 1000 if power >= 0 else None,
+            )
+            self.batteryRecordModel.append(
+                int(sample.timestamp), percent, sample.plugged, secsleft, []
+            )
+            self.historyWriter.append(sample)
+
+    def updateBattery(self, sample):
+        levels = (sample.percent,) + tuple(unit.percent for unit in sample.batteries)
+
+        if levels != self.prevLevels:
+            self.batteryRecordModel.append(
+                int(sample.timestamp),
+                sample.percent,
+                sample.plugged,
+                int(sample.secsleft),
+                [(unit.name, unit.percent) for unit in sample.batteries],
+            )
+            self.historyWriter.append(sample)
+            self.prevLevels = levels
 
     def restoreTry(self):
         self.showNormal()
@@ -597,8 +3769,30 @@ class MainWindow(QMainWindow):
         self.close_on_exit = True
         self.close()
 
+    def showEvent(self, event):
+        self.pollScheduler.setInteractive(True)
+        return super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.pollScheduler.setInteractive(False)
+        return super().hideEvent(event)
+
+    def stopSensorThread(self):
+        if self.sensorThread is not None:
+            self.sensorThread.quit()
+            self.sensorThread.wait()
+            self.sensorThread = None
+
     def closeEvent(self, event):
         if self.close_on_exit:
+            self.batterySampler.timer.stop()
+            self.stopSensorThread()
+            self.settingsWatcher.stop()
+            self.batteryRollups.flush()
+            self.historyWriter.close()
+            self.counterJournal.close(self.timeCounters)
+            if self.sampleRing is not None:
+                self.sampleRing.close()
             self.deleteLater()
         else:
             self.hide()
@@ -610,7 +3804,7 @@ class SettingsWindow(QMainWindow):
         super().__init__()
 
         self.entities = Entities()
-        self.settingsStatus = SettingsStatus()
+        self.settingsStatus = SettingsStatus.shared()
 
         self.initUI()
         self.batteryCareComboBoxStatus()
@@ -708,23 +3902,23 @@ class SettingsWindow(QMainWindow):
         self.batteryCareNotifComboBox.setEnabled(battery_care_enabled)
 
     def applySettings(self):
-        batteryCareValue = self.batteryCareComboBox.currentIndex() == 0
-        self.settingsStatus.setBatteryCare(batteryCareValue)
+        startAtStartupValue = self.startAtStartupComboBox.currentIndex() == 0
+        self.startAtStartupConfigure(startAtStartupValue)
 
-        batteryCareNotifValue = self.batteryCareNotifComboBox.currentIndex() == 0
-        self.settingsStatus.setBatteryCareNotif(batteryCareNotifValue)
+        with self.settingsStatus.batch():
+            batteryCareValue = self.batteryCareComboBox.currentIndex() == 0
+            self.settingsStatus.setBatteryCare(batteryCareValue)
 
-        startMinimizeValue = self.startComboBox.currentIndex() == 0
-        self.settingsStatus.setStartMinimize(startMinimizeValue)
+            batteryCareNotifValue = self.batteryCareNotifComboBox.currentIndex() == 0
+            self.settingsStatus.setBatteryCareNotif(batteryCareNotifValue)
 
-        startAtStartupValue = self.startAtStartupComboBox.currentIndex() == 0
-        self.startAtStartupConfigure(startAtStartupValue)
-        self.settingsStatus.setStartAtStartup(startAtStartupValue)
+            startMinimizeValue = self.startComboBox.currentIndex() == 0
+            self.settingsStatus.setStartMinimize(startMinimizeValue)
 
-        resetTimesValue = self.resetTimesComboBox.currentIndex() == 0
-        self.settingsStatus.setResetTimesAfterBatteryStatusChsnged(resetTimesValue)
+            self.settingsStatus.setStartAtStartup(startAtStartupValue)
 
-        self.settingsStatus.saveSettings()
+            resetTimesValue = self.resetTimesComboBox.currentIndex() == 0
+            self.settingsStatus.setResetTimesAfterBatteryStatusChsnged(resetTimesValue)
 
         QMessageBox.information(
             self, "Apply", "The new settings have been successfully applied."
@@ -792,6 +3986,7 @@ class ManualWindow(QMainWindow):
                 <li>On battery power on time: The total time since the battery was last fully charged while on battery power.</li>
                 <li>Plugged in power on time: The total time since the battery was last fully charged while plugged in.</li>
                 <li>Total in use time: The total time the battery has been in use.</li>
+                <li>Suspended time: The time the device spent asleep, which is not counted in the other times.</li>
                 <li>Remaining Battery Time: The estimated time remaining for the battery to be fully discharged or charged.</li>
                 <li>Battery Level: The current battery level as a percentage.</li>
                 <li>Brightness Level: The current brightness level of the display.</li>
@@ -851,20 +4046,756 @@ class ManualWindow(QMainWindow):
         self.deleteLater()
 
 
+class Benchmarks:
+    @staticmethod
+    def timePerCall(function, count):
+        start = time.perf_counter_ns()
+        for _ in range(count):
+            function()
+        return (time.perf_counter_ns() - start) / count
+
+    @staticmethod
+    def batteryBackend(count=10000):
+        entities = Entities()
+        results = {}
+        backends = [PsutilBatteryBackend()]
+        try:
+            backends.append(SysfsBatteryBackend(entities.powerSupplyPath))
+        except OSError:
+            pass
+        if sys.platform == "win32" and wmi is not None:
+            try:
+                backends.append(WmiBatteryBackend())
+            except (OSError, wmi.x_wmi):
+                pass
+
+        for backend in backends:
+            try:
+                backend.read()
+            except OSError as error:
+                print(f"{backend.name}: skipped ({error})")
+                backend.close()
+                continue
+            results[backend.name] = Benchmarks.timePerCall(backend.read, count)
+            backend.close()
+            print(f"{backend.name}: {results[backend.name] / 1000:.2f} us/sample")
+        return results
+
+    @staticmethod
+    def replay(path):
+        app = QApplication.instance() or QApplication([])
+        replayDir = tempfile.TemporaryDirectory(prefix="battery-tracker-replay-")
+        sensorBackend = ReplaySensorBackend(path)
+        mainWindow = MainWindow(
+            sensorBackend,
+            threaded=False,
+            historyFile=":memory:",
+            ringFile=False,
+            countersFile=os.path.join(replayDir.name, Entities.countersFile),
+            countersJournalFile=os.path.join(
+                replayDir.name, Entities.countersJournalFile
+            ),
+            settingsFile=os.path.join(replayDir.name, Entities.settingsFile),
+        )
+        mainWindow.batterySampler.timer.stop()
+
+        start = time.perf_counter()
+        while not sensorBackend.finished:
+            mainWindow.batterySampler.tick()
+        elapsed = time.perf_counter() - start
+
+        samples = mainWindow.batterySampler.reads
+        traceSpan = sensorBackend.now() - sensorBackend.traceStart
+        print(
+            f"{samples} samples in {elapsed:.3f} s: {samples / elapsed:.0f} samples/s"
+        )
+        print(
+            f"trace span {traceSpan / 3600:.1f} h replayed at {traceSpan / elapsed:.0f}x"
+        )
+        mainWindow.close_window()
+        sensorBackend.close()
+        replayDir.cleanup()
+        return samples / elapsed
+
+    @staticmethod
+    def check(condition, message):
+        if not condition:
+            raise AssertionError(message)
+
+    @staticmethod
+    def clockJumps(ticks=100000, windowTicks=5000):
+        secondNs = 1000000000
+
+        def jumpsFor(count):
+            return {count // 4: 3600, count // 2: -7200, 3 * count // 4: 5}
+
+        class WallClockBackend(SensorBackend):
+            def __init__(self):
+                self.jumps = jumpsFor(windowTicks)
+                self.reads = 0
+                self.wall = 1700000000.0
+                self.clockNs = 0
+
+            def now(self):
+                self.wall += 1 + self.jumps.get(self.reads, 0)
+                self.clockNs += secondNs
+                self.reads += 1
+                return self.wall
+
+            def monotonicNs(self):
+                return self.clockNs
+
+            def boottimeNs(self):
+                return None
+
+            def readBattery(self):
+                return BatteryReading(
+                    50,
+                    psutil.POWER_TIME_UNKNOWN,
+                    False,
+                    None,
+                    None,
+                    None,
+                    None,
+                    None,
+                    (BatteryUnit("BAT", 50, None, None, None, None, None),),
+                )
+
+        app = QApplication.instance() or QApplication([])
+        with tempfile.TemporaryDirectory(prefix="battery-clock-") as tempDir:
+            mainWindow = MainWindow(
+                WallClockBackend(),
+                threaded=False,
+                historyFile=":memory:",
+                ringFile=False,
+                countersFile=os.path.join(tempDir, Entities.countersFile),
+                countersJournalFile=os.path.join(tempDir, Entities.countersJournalFile),
+                settingsFile=os.path.join(tempDir, Entities.settingsFile),
+            )
+            mainWindow.batterySampler.timer.stop()
+            for _ in range(windowTicks):
+                mainWindow.batterySampler.tick()
+            timeCounters = mainWindow.timeCounters
+            reads = mainWindow.batterySampler.reads
+            mainWindow.close_window()
+
+        Benchmarks.check(
+            timeCounters.inUseNs == (reads - 1) * secondNs,
+            f"wall-clock jumps changed in use: {timeCounters.inUseNs}",
+        )
+        Benchmarks.check(
+            timeCounters.batteryNs == timeCounters.inUseNs
+            and timeCounters.pluggedNs == 0,
+            "battery time does not match in use",
+        )
+        Benchmarks.check(
+            timeCounters.suspendedNs == 0 and timeCounters.clockJumps == 0,
+            "wall-clock jumps were taken for a suspend or a clock step",
+        )
+
+        clockNs = [0]
+        tickClock = TickClock(lambda: clockNs[0])
+        tickClock.nextDelay(30)
+        clockNs[0] += secondNs
+        tickClock.nextDelay(1)
+        Benchmarks.check(
+            tickClock.resyncs == 0, "a shorter interval was counted as a resync"
+        )
+
+        jumps = jumpsFor(ticks)
+        clockNs = [0]
+        tickClock = TickClock(lambda: clockNs[0])
+        timeCounters = TimeCounters()
+        for tick in range(ticks):
+            delayMs = tickClock.nextDelay(1)
+            clockNs[0] += delayMs * 1000000 + jumps.get(tick, 0) * secondNs
+            timeCounters.accumulate(clockNs[0], tick % 2 == 0, None, secondNs)
+
+        expectedInUseNs = (ticks - 1 - 1 + 5) * secondNs
+        Benchmarks.check(
+            timeCounters.inUseNs == expectedInUseNs,
+            f"in use {TimeCounters.format(timeCounters.inUseNs)}, "
+            f"expected {TimeCounters.format(expectedInUseNs)}",
+        )
+        Benchmarks.check(
+            timeCounters.suspendedNs == 3600 * secondNs,
+            f"suspended {TimeCounters.format(timeCounters.suspendedNs)}, expected 1:00:00",
+        )
+        Benchmarks.check(timeCounters.clockJumps == 1, "backward step not detected")
+        Benchmarks.check(tickClock.resyncs == 1, "tick clock did not resync")
+        Benchmarks.check(
+            tickClock.overruns == 3600 + 5,
+            f"overruns {tickClock.overruns}, expected 3605",
+        )
+
+        print(f"ticks: {tickClock.ticks}, overruns: {tickClock.overruns}")
+        print(f"resyncs: {tickClock.resyncs}, clock jumps: {timeCounters.clockJumps}")
+        print(f"in use: {TimeCounters.format(timeCounters.inUseNs)}")
+        print(f"suspended: {TimeCounters.format(timeCounters.suspendedNs)}")
+        print("clock jump checks passed")
+        return tickClock, timeCounters
+
+    @staticmethod
+    def reportImport():
+        fixtures = {
+            "history-charge-DELL_5XJ28-72-1234.dat": (
+                "1700000000\t80.000\tdischarging\n"
+                "1700000600\t75.000\tdischarging\n"
+                "1700001200\t70.000\tcharging\n"
+                "garbage line\n"
+            ),
+            "history-rate-DELL_5XJ28-72-1234.dat": (
+                "1699999990\t10.000\tdischarging\n" "1700000590\t12.000\tdischarging\n"
+            ),
+            "battery-report.xml": (
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<BatteryReport xmlns="http://schemas.microsoft.com/battery/2012">'
+                "<RecentUsage>"
+                '<UsageEntry Timestamp="2023-05-01T08:00:00Z" Ac="0" '
+                'EntryType="Active" ChargeCapacity="41000" '
+                'FullChargeCapacity="50000"/>'
+                '<UsageEntry Timestamp="2023-05-01T09:00:00Z" Ac="1" '
+                'EntryType="Active" ChargeCapacity="30000" '
+                'FullChargeCapacity="50000"/>'
+                '<UsageEntry Timestamp="2023-05-01T10:00:00Z" Ac="1" '
+                'EntryType="Suspend" ChargeCapacity="0" FullChargeCapacity="0"/>'
+                "</RecentUsage></BatteryReport>\n"
+            ),
+            "battery-report.html": (
+                "<html><body><h2>Recent usage</h2><table><thead><tr>"
+                "<td>START TIME</td><td>STATE</td><td>SOURCE</td>"
+                '<td colspan="2">CAPACITY REMAINING</td></tr></thead>'
+                '<tr class="even dc 1"><td class="dateTime">'
+                '<span class="date">2023-06-01 </span>'
+                '<span class="time">08:01:12</span></td>'
+                '<td class="state">Active</td><td class="acdc">Battery</td>'
+                '<td class="percent">86 %</td><td class="mw">41,030 mWh</td></tr>'
+                '<tr class="odd ac 2"><td class="dateTime">'
+                '<span class="date"></span><span class="time">09:15:00</span></td>'
+                '<td class="state">Active</td><td class="acdc">AC</td>'
+                '<td class="percent">60 %</td><td class="mw">30,000 mWh</td></tr>'
+                '<tr class="even 3"><td class="dateTime"><span class="date"></span>'
+                '<span class="time">10:00:00</span></td>'
+                '<td class="state">Suspended</td><td class="acdc"></td>'
+                '<td class="percent">-</td><td class="mw">-</td></tr>'
+                "</table></body></html>\n"
+            ),
+        }
+
+        def localTime(text):
+            stamp = datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+            return int(stamp.timestamp())
+
+        unknown = psutil.POWER_TIME_UNKNOWN
+        unlimited = psutil.POWER_TIME_UNLIMITED
+        expected = sorted(
+            [
+                (1682928000, 82, 0, unknown),
+                (1682931600, 60, 1, unlimited),
+                (localTime("2023-06-01 08:01:12"), 86, 0, unknown),
+                (localTime("2023-06-01 09:15:00"), 60, 1, unlimited),
+                (1700000000, 80, 0, 20736),
+                (1700000600, 75, 0, 16200),
+                (1700001200, 70, 1, unlimited),
+            ]
+        )
+
+        with tempfile.TemporaryDirectory(prefix="battery-fixtures-") as fixtureDir:
+            for name, content in fixtures.items():
+                with open(os.path.join(fixtureDir, name), "w") as file:
+                    file.write(content)
+            paths = [os.path.join(fixtureDir, name) for name in fixtures]
+
+            historyStore = HistoryStore(":memory:")
+            importer = BatteryReportImporter(historyStore, workers=2)
+            start = time.perf_counter()
+            imported = importer.importFiles(paths)
+            elapsed = time.perf_counter() - start
+            rows = list(historyStore.iterSamples())
+            reimported = importer.importFiles(paths)
+            middle = rows[2:5]
+            rangeRows = list(historyStore.samples(middle[0][0], middle[-1][0] + 1))
+            summary = historyStore.aggregate(middle[0][0], middle[-1][0] + 1)
+            historyStore.close()
+
+        Benchmarks.check(rows == expected, f"imported rows {rows}, expected {expected}")
+        Benchmarks.check(imported == len(expected), f"imported {imported} samples")
+        Benchmarks.check(reimported == 0, f"re-import added {reimported} samples")
+        Benchmarks.check(rangeRows == middle, f"range query returned {rangeRows}")
+        Benchmarks.check(
+            summary["samples"] == 3
+            and summary["minPercent"] == min(row[1] for row in middle)
+            and summary["maxPercent"] == max(row[1] for row in middle)
+            and summary["pluggedSamples"] == sum(row[2] for row in middle)
+            and (summary["firstTime"], summary["lastTime"])
+            == (middle[0][0], middle[-1][0]),
+            f"range aggregate returned {summary}",
+        )
+        print(f"{len(fixtures)} fixture files imported in {elapsed * 1000:.1f} ms")
+        print("report import checks passed")
+        return rows
+
+    @staticmethod
+    def powerSupply(count=10000):
+        def writeAttribute(supply, name, value):
+            os.makedirs(os.path.join(supplyDir, supply), exist_ok=True)
+            with open(os.path.join(supplyDir, supply, name), "w") as file:
+                file.write(value + "\n")
+
+        with tempfile.TemporaryDirectory(prefix="battery-sysfs-") as supplyDir:
+            writeAttribute("AC", "type", "Mains")
+            writeAttribute("AC", "online", "0")
+            writeAttribute("BAT0", "type", "Battery")
+            writeAttribute("BAT0", "status", "Discharging")
+            writeAttribute("BAT0", "capacity", "90")
+            writeAttribute("hidpp_battery_0", "type", "Battery")
+            writeAttribute("hidpp_battery_0", "scope", "Device")
+            writeAttribute("hidpp_battery_0", "status", "Charging")
+            writeAttribute("hidpp_battery_0", "capacity", "10")
+
+            batteryBackend = SysfsBatteryBackend(supplyDir)
+            reading = batteryBackend.read()
+            batteryBackend.close()
+            Benchmarks.check(
+                [unit.name for unit in reading.batteries] == ["BAT0"]
+                and reading.percent == 90,
+                f"device batteries were counted: {reading}",
+            )
+
+            watcher = PowerSupplyWatcher(supplyDir)
+            changes = []
+            watcher.powerSourceChanged.connect(changes.append)
+            Benchmarks.check(watcher.plugged is False, "AC offline should read False")
+
+            writeAttribute("AC", "online", "1")
+            Benchmarks.check(watcher.check(), "plugging in should report a change")
+            Benchmarks.check(not watcher.check(), "an unchanged source was reported")
+
+            os.remove(os.path.join(supplyDir, "AC", "online"))
+            writeAttribute("BAT0", "status", "Charging")
+            Benchmarks.check(
+                watcher.readPlugged() is True, "a charging battery should read True"
+            )
+            writeAttribute("BAT0", "status", "Discharging")
+            Benchmarks.check(watcher.check(), "unplugging should report a change")
+            Benchmarks.check(
+                changes == [True, False], f"emitted {changes}, expected [True, False]"
+            )
+
+            elapsed = Benchmarks.timePerCall(watcher.readPlugged, count)
+
+        Benchmarks.check(
+            PowerSupplyWatcher(supplyDir).readPlugged() is None,
+            "a missing sysfs tree should read None",
+        )
+        Benchmarks.check(
+            PowerSupplyWatcher.isPowerSupplyEvent(
+                b"change@/devices/AC\0ACTION=change\0SUBSYSTEM=power_supply\0"
+            ),
+            "power_supply uevent not recognised",
+        )
+        Benchmarks.check(
+            not PowerSupplyWatcher.isPowerSupplyEvent(
+                b"change@/devices/card0\0ACTION=change\0SUBSYSTEM=drm\0"
+            ),
+            "drm uevent taken for a power_supply event",
+        )
+
+        class PlugBackend(SensorBackend):
+            plugged = False
+
+            def monotonicNs(self):
+                return 0
+
+            def readBattery(self):
+                return BatteryReading(
+                    50,
+                    psutil.POWER_TIME_UNKNOWN,
+                    self.plugged,
+                    None,
+                    None,
+                    None,
+                    None,
+                    None,
+                    (BatteryUnit("BAT", 50, None, None, None, None, None),),
+                )
+
+        app = QApplication.instance() or QApplication([])
+        sensorBackend = PlugBackend()
+        sensorWorker = SensorWorker(sensorBackend)
+        batterySampler = BatterySampler(1, sensorWorker)
+        delivered = []
+        batterySampler.subscribe(delivered.append)
+        batterySampler.tick()
+        batterySampler.tick()
+        Benchmarks.check(len(delivered) == 1, "the throttle let a second read through")
+        batterySampler.tick(force=True)
+        Benchmarks.check(len(delivered) == 2, "a forced tick was throttled")
+        sensorBackend.plugged = True
+        batterySampler.tick()
+        Benchmarks.check(len(delivered) == 3, "a plug change was throttled")
+        batterySampler.timer.stop()
+
+        print(f"readPlugged: {elapsed / 1000:.2f} us/call")
+        print("power supply checks passed")
+        return elapsed
+
+    @staticmethod
+    def ringBuffer(count=100000):
+        app = QApplication.instance() or QApplication([])
+        ringFile = Entities.ringFile + ".bench"
+        sampleRing = SampleRingFile(ringFile, count)
+
+        start = time.perf_counter_ns()
+        for i in range(count):
+            sampleRing.append(i * 1000, i % 101, i & 1, 12000, 3600)
+        ringNs = (time.perf_counter_ns() - start) / count
+
+        for i in range(count, count + 10):
+            sampleRing.append(i * 1000, i % 101, i & 1, 12000, 3600)
+        newer = [
+            record[0] // 1000 for record in sampleRing.newerThan(count * 1000 + 4999)
+        ]
+        Benchmarks.check(
+            newer == list(range(count + 5, count + 10)),
+            f"newerThan returned {newer[:10]} across the wrap",
+        )
+        Benchmarks.check(
+            len(list(sampleRing.newerThan(-1))) == count,
+            "newerThan did not stop at the tail",
+        )
+
+        tableWidget = QTableWidget()
+        tableWidget.setColumnCount(4)
+        start = time.perf_counter_ns()
+        for i in range(count):
+            tableWidget.insertRow(i)
+            for column, text in enumerate(("12:00", "50%", "Plugged", "Charging")):
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignCenter)
+                tableWidget.setItem(i, column, item)
+        tableNs = (time.perf_counter_ns() - start) / count
+
+        sampleRing.close()
+        os.remove(ringFile)
+        print(f"ring file: {ringNs / 1000:.2f} us/append, {1e9 / ringNs:.0f}/s")
+        print(f"QTableWidget: {tableNs / 1000:.2f} us/row, {1e9 / tableNs:.0f}/s")
+        return ringNs, tableNs
+
+    @staticmethod
+    def settingsGet(count=20000):
+        settingsFile = "program-settings.bench.json"
+        settingsStatus = SettingsStatus(settingsFile)
+
+        def uncachedGet():
+            settingsStatus.loadSettings()
+            return settingsStatus.batteryCare
+
+        uncachedNs = Benchmarks.timePerCall(uncachedGet, count)
+        cachedNs = Benchmarks.timePerCall(settingsStatus.getBatteryCare, count)
+
+        os.remove(settingsFile)
+        print(f"re-read per get: {uncachedNs / 1000:.2f} us/get")
+        print(f"cached get: {cachedNs / 1000:.2f} us/get")
+        return uncachedNs, cachedNs
+
+    @staticmethod
+    def batteryRecord(count=10**7):
+        app = QApplication.instance() or QApplication([])
+        historyColumns = SampleColumns()
+        batteryRecordModel = BatteryRecordModel(
+            historyColumns, MainWindow.formatRemaining
+        )
+
+        start = time.perf_counter()
+        batteryRecordModel.extend(
+            (1700000000 + i * 60, i % 101, i // 500 % 2 == 0, 3600 + i % 7200)
+            for i in range(count)
+        )
+        buildSeconds = time.perf_counter() - start
+
+        tableView = CustomTableView()
+        tableView.setModel(batteryRecordModel)
+        tableView.resize(600, 400)
+        tableView.show()
+        app.processEvents()
+
+        generator = random.Random(2273)
+        start = time.perf_counter_ns()
+        for _ in range(100):
+            tableView.scrollTo(batteryRecordModel.index(generator.randrange(count), 0))
+            tableView.viewport().repaint()
+        scrollMs = (time.perf_counter_ns() - start) / 100 / 1000000
+
+        start = time.perf_counter_ns()
+        batteryRecordModel.append(1700000000 + count * 60, 50, False, 3600)
+        tableView.scrollToBottom()
+        tableView.viewport().repaint()
+        appendMs = (time.perf_counter_ns() - start) / 1000000
+
+        bytesPerRow = batteryRecordModel.bytesPerRow()
+        tableView.close()
+        print(f"{count} rows loaded in {buildSeconds:.1f} s")
+        print(f"memory: {bytesPerRow:.2f} bytes/row")
+        print(f"random scroll + repaint: {scrollMs:.2f} ms")
+        print(f"append + scroll to bottom + repaint: {appendMs:.2f} ms")
+        return bytesPerRow, scrollMs, appendMs
+
+    @staticmethod
+    def columnSizing(sizes=(10**3, 10**5, 10**6), resizes=20):
+        app = QApplication.instance() or QApplication([])
+        results = {}
+        for count in sizes:
+            historyColumns = SampleColumns()
+            batteryRecordModel = BatteryRecordModel(
+                historyColumns, MainWindow.formatRemaining
+            )
+            batteryRecordModel.extend(
+                (1700000000 + i * 60, i % 101, i // 500 % 2 == 0, 3600 + i % 7200)
+                for i in range(count)
+            )
+
+            tableView = CustomTableView()
+            start = time.perf_counter_ns()
+            tableView.setModel(batteryRecordModel)
+            setupMs = (time.perf_counter_ns() - start) / 1000000
+            tableView.show()
+            app.processEvents()
+
+            def resizeMs():
+                start = time.perf_counter_ns()
+                for i in range(resizes):
+                    tableView.resize(300 + i % 2 * 400, 400)
+                return (time.perf_counter_ns() - start) / resizes / 1000000
+
+            incrementalMs = resizeMs()
+
+            def contentsResizeEvent(event):
+                tableView.resizeColumnsToContents()
+                return QTableView.resizeEvent(tableView, event)
+
+            tableView.resizeEvent = contentsResizeEvent
+            contentsMs = resizeMs()
+
+            tableView.close()
+            results[count] = contentsMs, incrementalMs
+            print(f"{count} rows (initial sizing {setupMs:.2f} ms)")
+            print(f"  resizeColumnsToContents: {contentsMs:.2f} ms/resize")
+            print(f"  incremental widths: {incrementalMs:.2f} ms/resize")
+        return results
+
+    @staticmethod
+    def syntheticSamples(days, interval, seed=2273):
+        generator = random.Random(seed)
+        timestamp = 1700000000
+        percent = 100
+        plugged = False
+        for _ in range(days * 24 * 3600 // interval):
+            timestamp += interval + generator.choice((-1, 0, 0, 0, 1))
+            if generator.random() < 0.15:
+                percent = max(0, min(100, percent + (1 if plugged else -1)))
+            if percent <= 20 or (percent >= 95 and generator.random() < 0.02):
+                plugged = percent <= 20
+            secsleft = -2 if plugged else percent * 180
+            yield timestamp, percent, plugged, secsleft
+
+    @staticmethod
+    def sampleCodec(days=365, interval=60):
+        samples = list(Benchmarks.syntheticSamples(days, interval))
+        textBytes = sum(
+            len("HH:mm")
+            + len(f"{percent}%")
+            + len("Plugged" if plugged else "Unplugged")
+            + len("Charging" if plugged else f"{secsleft // 3600} H : 0 Min")
+            for _, percent, plugged, secsleft in samples
+        )
+
+        encoder = SampleEncoder()
+        chunks = []
+        start = time.perf_counter()
+        for sample in samples:
+            chunk = encoder.encode(*sample)
+            if chunk:
+                chunks.append(chunk)
+        chunks.append(encoder.finish())
+        encodeSeconds = time.perf_counter() - start
+
+        decoder = SampleDecoder()
+        decoded = 0
+        start = time.perf_counter()
+        for chunk in chunks:
+            decoded += len(decoder.feed(chunk))
+        decodeSeconds = time.perf_counter() - start
+
+        decoder = SampleDecoder()
+        stream = b"".join(chunks)
+        records = []
+        for offset in range(0, len(stream), 7):
+            records.extend(decoder.feed(stream[offset : offset + 7]))
+        Benchmarks.check(
+            records == [tuple(sample) for sample in samples],
+            "decoding a byte-split stream did not round-trip",
+        )
+        decoder = SampleDecoder()
+        decoder.feed(stream[:3])
+        Benchmarks.check(
+            len(decoder.feed(stream[3:])) == len(samples),
+            "a partial header chunk was dropped",
+        )
+
+        encodedBytes = sum(len(chunk) for chunk in chunks)
+        count = len(samples)
+        print(f"{count} samples ({days} days every {interval} s)")
+        print(f"text rows: {textBytes / count:.2f} bytes/sample")
+        print(f"encoded: {encodedBytes / count:.2f} bytes/sample")
+        print(f"encode: {count / encodeSeconds:.0f} samples/s")
+        print(f"decode: {decoded / decodeSeconds:.0f} samples/s")
+        return encodedBytes / count, decoded / decodeSeconds
+
+    @staticmethod
+    def historyQuery(sizes=(10**6, 10**8), queries=1000):
+        results = {}
+        generator = random.Random(2273)
+        for size in sizes:
+            historyColumns = SampleColumns()
+            blockSize = historyColumns.blockSize
+            start = time.perf_counter()
+            for first in range(0, size, blockSize):
+                count = min(blockSize, size - first)
+                historyColumns.extend(
+                    (
+                        1700000000 + (first + index) * 60,
+                        (first + index) % 101,
+                        (first + index) // 500 % 2 == 0,
+                        3600,
+                    )
+                    for index in range(count)
+                )
+            buildSeconds = time.perf_counter() - start
+
+            firstTime = historyColumns.times[0]
+            lastTime = historyColumns.times[-1]
+            ranges = []
+            for _ in range(queries):
+                rangeStart = generator.randint(firstTime, lastTime)
+                ranges.append((rangeStart, rangeStart + 2 * 3600))
+
+            start = time.perf_counter()
+            for rangeStart, rangeEnd in ranges:
+                for _ in historyColumns.samples(rangeStart, rangeEnd):
+                    pass
+            samplesUs = (time.perf_counter() - start) / queries * 1e6
+
+            start = time.perf_counter()
+            for _ in range(queries // 10):
+                historyColumns.aggregate(firstTime, lastTime)
+            aggregateUs = (time.perf_counter() - start) / (queries // 10) * 1e6
+
+            results[size] = samplesUs, aggregateUs
+            print(f"{size} samples built in {buildSeconds:.1f} s")
+            print(f"  2 h range samples: {samplesUs:.1f} us/query")
+            print(f"  full range aggregate: {aggregateUs:.1f} us/query")
+        return results
+
+    @staticmethod
+    def run(args):
+        if args.benchmark == "replay":
+            return Benchmarks.replay(args.replay)
+        return getattr(Benchmarks, args.benchmark)()
+
+
 def main():
-    elevate.elevate()
+    parser = argparse.ArgumentParser(prog=Entities.appName)
+    parser.add_argument(
+        "--benchmark",
+        choices=[
+            "batteryBackend",
+            "replay",
+            "clockJumps",
+            "reportImport",
+            "powerSupply",
+            "ringBuffer",
+            "sampleCodec",
+            "historyQuery",
+            "settingsGet",
+            "batteryRecord",
+            "columnSizing",
+        ],
+        help="run a microbenchmark",
+    )
+    parser.add_argument("--replay", help="replay a CSV/JSONL battery trace")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="replay speed-up factor"
+    )
+    parser.add_argument("--export", help="export the battery history and exit")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "jsonl", "columnar"],
+        help="export format (default: from the file extension)",
+    )
+    parser.add_argument(
+        "--import",
+        dest="importPaths",
+        nargs="+",
+        metavar="PATH",
+        help="backfill history from powercfg battery reports or upower files",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        Benchmarks.run(args)
+        return
+
+    if args.importPaths:
+        historyStore = HistoryStore(Entities.historyFile)
+        try:
+            imported = BatteryReportImporter(historyStore).importFiles(args.importPaths)
+        finally:
+            historyStore.close()
+        print(f"Imported {imported} samples")
+        return
+
+    if args.export:
+        historyStore = HistoryStore(Entities.historyFile)
+        try:
+            HistoryExporter().export(
+                historyStore.iterSamples(), args.export, args.format
+            )
+        finally:
+            historyStore.close()
+        return
+
+    sensorBackend = None
+    windowFiles = {}
+    if args.replay:
+        sensorBackend = ReplaySensorBackend(args.replay, args.speed)
+        replayDir = tempfile.mkdtemp(prefix="battery-tracker-replay-")
+        windowFiles = {
+            "historyFile": os.path.join(replayDir, Entities.historyFile),
+            "ringFile": False,
+            "countersFile": os.path.join(replayDir, Entities.countersFile),
+            "countersJournalFile": os.path.join(
+                replayDir, Entities.countersJournalFile
+            ),
+            "settingsFile": os.path.join(replayDir, Entities.settingsFile),
+        }
+    else:
+        elevate.elevate()
 
     app = QApplication([])
 
     entities = Entities()
 
+    if not args.replay:
+        LegacyMigration.fromEntities(entities).run()
+
     app.setStyle(entities.appStyle)
     app.setApplicationName(entities.appName)
     app.setApplicationVersion(entities.appVersion)
     app.setWindowIcon(QIcon(entities.appIcon))
 
-    mainWindow = MainWindow()
-    settingsStatus = SettingsStatus()
+    mainWindow = MainWindow(sensorBackend, **windowFiles)
+    settingsStatus = SettingsStatus.shared()
     if not settingsStatus.getStartMinimize():
         mainWindow.showNormal()
         mainWindow.activateWindow()